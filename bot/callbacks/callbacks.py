@@ -1,9 +1,9 @@
 import logging
 import os
 from aiogram import Router, types
-from aiogram.types import FSInputFile
 from bot.messages import Messages
 from bot.config import Config
+from bot.services.static_assets import StaticAssetRegistry
 from bot.utils.channel_checker import check_user_subscription
 
 
@@ -12,15 +12,13 @@ callback_router = Router()
 
 
 @callback_router.callback_query(lambda c: c.data == 'check_channel_subscription')
-async def handle_subscription_check(callback_query: types.CallbackQuery, supabase_client):
+async def handle_subscription_check(callback_query: types.CallbackQuery, supabase_client, user,
+                                    static_assets: StaticAssetRegistry):
     """Handle subscription verification and send book if subscribed"""
     try:
         user_id = callback_query.from_user.id
         bot = callback_query.bot
 
-        # Get user from database
-        user = await supabase_client.get_user_by_telegram_id(user_id)
-
         if not user:
             await callback_query.answer("Ошибка: пользователь не найден. Попробуйте /start снова.")
             return
@@ -48,10 +46,11 @@ async def handle_subscription_check(callback_query: types.CallbackQuery, supabas
                     await callback_query.answer("❌ Ошибка: файл книги не найден. Обратитесь к администратору.")
                     return
 
-                # Send the PDF book
-                book_file = FSInputFile(Config.VITAMIN_BOOK_PATH)
-                await callback_query.message.answer_document(
-                    document=book_file,
+                # Send the PDF book (uploaded once, then re-sent by file_id)
+                await static_assets.send_document(
+                    bot,
+                    callback_query.message.chat.id,
+                    Config.VITAMIN_BOOK_PATH,
                     caption=Messages.START_CMD["book_sent"]
                 )
 
@@ -1,3 +1,5 @@
+import asyncio
+import html
 import logging
 import os
 import json
@@ -10,6 +12,16 @@ from datetime import datetime, timedelta
 from bot.messages import Messages
 from bot.config import Config
 from bot.services.notification_scheduler import NotificationScheduler
+from bot.utils.pagination import user_pagination_data
+from bot.utils.channel_checker import get_subscription_stats, reverify_subscriptions
+from bot.utils.metrics import metrics
+
+# Display names of notification frequencies shown during time selection
+FREQUENCY_NAMES = {
+    'daily': 'каждый день',
+    'weekdays': 'только рабочие дни',
+    'weekends': 'только выходные'
+}
 
 # FSM States for notification setup
 class NotificationStates(StatesGroup):
@@ -34,24 +46,12 @@ start_router = Router()
 content_router = Router()
 
 @start_router.message(CommandStart())
-async def cmd_start(message: types.Message, supabase_client):
+async def cmd_start(message: types.Message, user):
     """Start command handler"""
     user_name = message.from_user.first_name
     await message.answer(Messages.START_CMD["welcome"](user_name))
 
-    try:
-        # Register user in Supabase
-        await supabase_client.create_user(
-            telegram_id=message.from_user.id,
-            username=message.from_user.username,
-            first_name=message.from_user.first_name,
-            last_name=message.from_user.last_name
-        )
-    except Exception as e:
-        logging.warning(f"User registration error: {e}")
-
-    # Check if user already received the vitamin book
-    user = await supabase_client.get_user_by_telegram_id(message.from_user.id)
+    # User is registered in Supabase by UserContextMiddleware on first access
 
     # Only show vitamin book promo if user hasn't received it yet
     if not user or not user.book_received:
@@ -133,12 +133,11 @@ async def process_date_selection(callback_query: types.CallbackQuery):
     )
 
 @content_router.callback_query(lambda c: c.data.startswith('slot_'))
-async def process_slot_selection(callback_query: types.CallbackQuery, supabase_client):
+async def process_slot_selection(callback_query: types.CallbackQuery, user):
     """Handle time slot selection for booking"""
     try:
         _, date, time = callback_query.data.split('_', 2)
         
-        user = await supabase_client.get_user_by_telegram_id(callback_query.from_user.id)
         if user:
             # Here you would save the booking to your database
             # For now, just confirm the booking
@@ -155,12 +154,10 @@ async def process_slot_selection(callback_query: types.CallbackQuery, supabase_c
 
 
 @content_router.message(Command('settings'))
-async def settings_command(message: types.Message, supabase_client):
+async def settings_command(message: types.Message, user):
     """Settings command handler"""
     try:
-        # Get current user settings from database
-        user = await supabase_client.get_user_by_telegram_id(message.from_user.id)
-        
+        # Current user settings are loaded by UserContextMiddleware
         if user:
             audio_status = "🔊 Аудио" if user.isAudio else "📝 Текст"
             notif_status = "🔔 Включены" if user.notification else "🔕 Отключены"
@@ -445,12 +442,7 @@ async def handle_timezone_selection(callback_query: types.CallbackQuery, supabas
         await supabase_client.create_or_update_user(user_data)
         
         # Get frequency name for display
-        frequency_names = {
-            'daily': 'каждый день',
-            'weekdays': 'только рабочие дни', 
-            'weekends': 'только выходные'
-        }
-        frequency_name = frequency_names.get(frequency_key, frequency_key)
+        frequency_name = FREQUENCY_NAMES.get(frequency_key, frequency_key)
         
         # Now show time selection
         await show_time_selection(callback_query, frequency_key, frequency_name, page=0)
@@ -460,7 +452,7 @@ async def handle_timezone_selection(callback_query: types.CallbackQuery, supabas
         await callback_query.answer("Произошла ошибка при сохранении часового пояса")
 
 @content_router.callback_query(lambda c: c.data in ['notifications_on', 'notifications_off'])
-async def handle_notifications_selection(callback_query: types.CallbackQuery, supabase_client):
+async def handle_notifications_selection(callback_query: types.CallbackQuery, supabase_client, user):
     """Handle notifications setting selection"""
     notifications_enabled = callback_query.data == 'notifications_on'
     
@@ -490,7 +482,6 @@ async def handle_notifications_selection(callback_query: types.CallbackQuery, su
             await supabase_client.create_or_update_user(user_data)
             
             # Clear notification settings
-            user = await supabase_client.get_user_by_telegram_id(callback_query.from_user.id)
             if user:
                 await supabase_client.create_or_update_notification_settings(user.id, {})
             
@@ -510,10 +501,9 @@ async def handle_notifications_selection(callback_query: types.CallbackQuery, su
             pass
 
 @content_router.callback_query(lambda c: c.data.startswith('notif_freq_'))
-async def handle_notification_frequency_selection(callback_query: types.CallbackQuery, supabase_client, state: FSMContext):
+async def handle_notification_frequency_selection(callback_query: types.CallbackQuery, supabase_client, user, state: FSMContext):
     """Handle notification frequency selection"""
     try:
-        user = await supabase_client.get_user_by_telegram_id(callback_query.from_user.id)
         if not user:
             await callback_query.answer("Ошибка: пользователь не найден")
             return
@@ -560,6 +550,13 @@ async def show_time_selection(callback_query: types.CallbackQuery, frequency_key
         
         # Ensure page is within bounds
         page = max(0, min(page, total_pages - 1))
+
+        # Remember where the user is in the flow for page navigation
+        user_pagination_data.set(f"{callback_query.from_user.id}:time", {
+            'frequency_key': frequency_key,
+            'frequency_name': frequency_name,
+            'page': page
+        })
         
         # Get hours for current page
         start_hour = page * hours_per_page
@@ -628,11 +625,21 @@ async def handle_time_page_navigation(callback_query: types.CallbackQuery):
     try:
         # Parse callback data: time_page_{frequency_key}_{frequency_name}_{page}
         parts = callback_query.data.split('_', 4)
+        session = user_pagination_data.get(f"{callback_query.from_user.id}:time")
+        frequency_key = None
         if len(parts) >= 5:
             frequency_key = parts[2]
             frequency_name = parts[3]
             page = int(parts[4])
-            
+        elif len(parts) == 4:
+            # Short form time_page_{page}_{frequency_key}; the session may have expired or been
+            # evicted, so the frequency name falls back to the one derived from the key
+            page = int(parts[2])
+            frequency_key = parts[3]
+            default_name = FREQUENCY_NAMES.get(frequency_key, frequency_key)
+            frequency_name = session.get('frequency_name', default_name) if session else default_name
+
+        if frequency_key:
             await show_time_selection(callback_query, frequency_key, frequency_name, page)
             try:
                 await callback_query.answer()
@@ -649,7 +656,7 @@ async def handle_time_page_navigation(callback_query: types.CallbackQuery):
             pass
 
 @content_router.callback_query(lambda c: c.data.startswith('notif_time_'))
-async def handle_notification_time_selection(callback_query: types.CallbackQuery, supabase_client):
+async def handle_notification_time_selection(callback_query: types.CallbackQuery, supabase_client, user):
     """Handle final notification time selection"""
     try:
         # Parse callback data: notif_time_{frequency}_{time}
@@ -658,7 +665,6 @@ async def handle_notification_time_selection(callback_query: types.CallbackQuery
             frequency = parts[2]
             time = parts[3]
             
-            user = await supabase_client.get_user_by_telegram_id(callback_query.from_user.id)
             if not user:
                 try:
                     await callback_query.answer("Ошибка: пользователь не найден")
@@ -946,6 +952,160 @@ async def statistics_command(message: types.Message, supabase_client):
         logging.error(f"Error in statistics command: {e}")
         await message.answer("❌ Произошла ошибка при получении статистики")
 
+@content_router.message(Command('verify_subscriptions'))
+async def verify_subscriptions_command(message: types.Message, supabase_client):
+    """Re-check channel subscription of everyone who received the book - admin only"""
+    try:
+        # Check if user is admin
+        admin_ids = Config.get_admin_ids()
+        if message.from_user.id not in admin_ids:
+            await message.answer("⛔ У вас нет доступа к этой команде.")
+            return
+
+        user_ids = await supabase_client.get_book_recipient_ids()
+        await message.answer(f"🔄 Проверяю подписку у {len(user_ids)} пользователей...")
+
+        result = await reverify_subscriptions(message.bot, user_ids)
+        stats = get_subscription_stats()
+
+        await message.answer(
+            f"📊 <b>Проверка подписок завершена</b>\n\n"
+            f"👥 Проверено: {result['checked']}\n"
+            f"✅ Подписаны: {result['subscribed']}\n"
+            f"❌ Не подписаны: {result['not_subscribed']}\n"
+            f"⚠️ Ошибки: {result['errors']}\n\n"
+            f"<b>Кэш подписок</b>\n"
+            f"• Попадания: {stats['hits']} / промахи: {stats['misses']} ({stats['hit_ratio'] * 100:.1f}%)\n"
+            f"• Запросов к Telegram: {stats['api_calls']}, объединено: {stats['coalesced']}\n"
+            f"• В кэше: {stats['size']}",
+            parse_mode="HTML"
+        )
+
+    except Exception as e:
+        logging.error(f"Error in verify subscriptions command: {e}")
+        await message.answer("❌ Произошла ошибка при проверке подписок")
+
+@content_router.message(Command('warmup'))
+async def warmup_command(message: types.Message, warmup):
+    """Show startup warm-up status and per-component timings - admin only"""
+    try:
+        # Check if user is admin
+        admin_ids = Config.get_admin_ids()
+        if message.from_user.id not in admin_ids:
+            await message.answer("⛔ У вас нет доступа к этой команде.")
+            return
+
+        status = warmup.status()
+        lines = []
+        for name, component in status['components'].items():
+            if component['ms'] is None:
+                lines.append(f"⏳ {name}: выполняется")
+            elif component['ok']:
+                lines.append(f"✅ {name}: {component['ms']} мс")
+            else:
+                lines.append(f"❌ {name}: {component['ms']} мс ({html.escape(component['error'])})")
+
+        header = (f"🟢 <b>Бот готов</b>, прогрев занял {status['total_ms']} мс"
+                  if status['ready'] else "🟡 <b>Идет прогрев</b>")
+        await message.answer(header + "\n\n" + "\n".join(lines), parse_mode="HTML")
+
+    except Exception as e:
+        logging.error(f"Error in warmup command: {e}")
+        await message.answer("❌ Произошла ошибка при получении статуса прогрева")
+
+PERF_WINDOWS = {'1m': 60, '15m': 15 * 60, '1h': 60 * 60}
+
+def format_duration(seconds: float) -> str:
+    """Compact duration for the /perf table"""
+    if seconds >= 1:
+        return f"{seconds:.1f}s"
+    return f"{seconds * 1000:.0f}ms"
+
+def format_hit_ratio(hits: int, misses: int) -> str:
+    lookups = hits + misses
+    return f"{hits / lookups * 100:.0f}% ({hits}/{lookups})" if lookups else "нет запросов"
+
+@content_router.message(Command('perf'))
+async def perf_command(message: types.Message, transcription_service, tts_cache, static_assets, loop_monitor):
+    """Show latency percentiles, throughput, errors and cache efficiency of this process - admin only"""
+    try:
+        # Check if user is admin
+        admin_ids = Config.get_admin_ids()
+        if message.from_user.id not in admin_ids:
+            await message.answer("⛔ У вас нет доступа к этой команде.")
+            return
+
+        # Optional argument picks the window of the stage table: /perf 1m | 15m | 1h
+        args = (message.text or '').split()
+        table_window = args[1] if len(args) > 1 and args[1] in PERF_WINDOWS else '15m'
+
+        lines = [f"⚡️ <b>Производительность</b> (процесс {os.getpid()})\n"]
+
+        # Throughput and errors of the whole question pipeline over every window
+        lines.append("<b>Вопросы</b>")
+        for name, seconds in PERF_WINDOWS.items():
+            question = metrics.window_stats(seconds).get('question.total')
+            if question:
+                lines.append(
+                    f"• {name}: {question['count']} ({question['rate'] * 60:.1f}/мин), "
+                    f"p95 {format_duration(question['p95'])}, ошибок {question['errors']}"
+                )
+            else:
+                lines.append(f"• {name}: нет запросов")
+
+        # Per-stage percentiles for the selected window
+        stages = metrics.window_stats(PERF_WINDOWS[table_window])
+        lines.append(f"\n<b>Этапы за {table_window}</b>")
+        if stages:
+            width = max(len(stage) for stage in stages)
+            rows = [f"{'stage':<{width}} {'n':>5} {'p50':>6} {'p95':>6} {'p99':>6} {'err':>4}"]
+            for stage, stats in stages.items():
+                rows.append(
+                    f"{stage:<{width}} {stats['count']:>5} {format_duration(stats['p50']):>6} "
+                    f"{format_duration(stats['p95']):>6} {format_duration(stats['p99']):>6} {stats['errors']:>4}"
+                )
+            lines.append("<pre>" + html.escape("\n".join(rows)) + "</pre>")
+        else:
+            lines.append("Нет данных")
+
+        # Work in progress right now: upstream calls, callers waiting for a concurrency slot, loop tasks
+        running = {stage: count for stage, count in sorted(metrics.in_flight.items()) if count > 0}
+        queues = {stage: count for stage, count in running.items() if stage.endswith('.queue')}
+        calls = {stage: count for stage, count in running.items() if not stage.endswith('.queue')}
+        lines.append("\n<b>Сейчас</b>")
+        lines.append("• Выполняются: " + (", ".join(f"{stage} {count}" for stage, count in calls.items()) or "нет"))
+        lines.append("• В очереди: " + (", ".join(f"{stage} {count}" for stage, count in queues.items()) or "нет"))
+        lines.append(f"• Задач в event loop: {len(asyncio.all_tasks())}")
+
+        # Code that blocked the event loop since start
+        if loop_monitor is not None and loop_monitor.stalls:
+            lines.append("\n<b>Блокировки event loop</b>")
+            for location, count in loop_monitor.top_locations():
+                lines.append(f"• {count}× <code>{html.escape(location)}</code>")
+
+        # Cache efficiency since start
+        lines.append("\n<b>Кэши</b>")
+        if transcription_service.cache is not None:
+            cache_stats = transcription_service.cache.get_stats()
+            lines.append(f"• Распознавание: {format_hit_ratio(cache_stats['hits'], cache_stats['misses'])}")
+        subscription = get_subscription_stats()
+        lines.append(f"• Подписки: {format_hit_ratio(subscription['hits'], subscription['misses'])}, "
+                     f"объединено {subscription['coalesced']}")
+        if tts_cache is not None:
+            tts_stats = tts_cache.get_stats()
+            file_id_stats = tts_cache.file_ids.get_stats()
+            lines.append(f"• Озвучка (аудио): {format_hit_ratio(tts_stats['hits'], tts_stats['misses'])}")
+            lines.append(f"• Озвучка (file_id): {format_hit_ratio(file_id_stats['hits'], file_id_stats['misses'])}")
+        lines.append(f"• Файлы (file_id): {format_hit_ratio(static_assets.stats['file_id_sends'], static_assets.stats['uploads'])}")
+        pagination = user_pagination_data.get_stats()
+        lines.append(f"• Пагинация: {format_hit_ratio(pagination['hits'], pagination['misses'])}")
+
+        await message.answer("\n".join(lines), parse_mode="HTML")
+
+    except Exception as e:
+        logging.error(f"Error in perf command: {e}")
+        await message.answer("❌ Произошла ошибка при получении метрик")
+
 # Location-based timezone handlers
 @content_router.message(lambda message: message.location is not None, NotificationStates.waiting_for_timezone_location)
 async def handle_location_timezone(message: types.Message, state: FSMContext, supabase_client):
@@ -1104,6 +1264,13 @@ async def show_time_selection_from_state(message: types.Message, frequency_key:
     
     # Ensure page is within bounds
     page = max(0, min(page, total_pages - 1))
+
+    # Remember frequency name for the short-form page navigation callbacks below
+    user_pagination_data.set(f"{message.from_user.id}:time", {
+        'frequency_key': frequency_key,
+        'frequency_name': frequency_name,
+        'page': page
+    })
     
     # Calculate start and end hours for current page
     start_hour = page * hours_per_page
@@ -34,11 +34,86 @@ class Config:
 
     # Channel subscription settings
     CHANNEL_USERNAME = os.getenv('CHANNEL_USERNAME', 'odnimsalatom')
+    SUBSCRIPTION_CACHE_TTL = int(os.getenv('SUBSCRIPTION_CACHE_TTL', '600'))  # Seconds a "subscribed" status is trusted
+    SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv('SUBSCRIPTION_NEGATIVE_TTL', '5'))  # Short, users re-check right after joining
+    SUBSCRIPTION_CACHE_SIZE = int(os.getenv('SUBSCRIPTION_CACHE_SIZE', '50000'))
+    SUBSCRIPTION_VERIFY_CONCURRENCY = int(os.getenv('SUBSCRIPTION_VERIFY_CONCURRENCY', '3'))  # Batch re-verification
+    SUBSCRIPTION_VERIFY_DELAY = float(os.getenv('SUBSCRIPTION_VERIFY_DELAY', '0.2'))  # Pause after each batch call
     VITAMIN_BOOK_PATH = os.path.join(os.path.dirname(__file__), '..', 'Витаминный_состав_для_ежедневного_питания_Шаркова_Диетолог_pdf.pdf')
+    STATIC_ASSETS_PATH = os.getenv('STATIC_ASSETS_PATH', os.path.join(os.path.dirname(__file__), '..', 'data', 'static_assets.sqlite3'))  # Telegram file_ids of uploaded files
 
     # Booking settings
     BOOKING_LINK = os.getenv('booking_link', 'https://qlick.io/widget/alexander-97/meeting-60m/start')
 
+    # Update delivery settings: "polling" (default) or "webhook"
+    BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+    WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL')  # Public HTTPS URL Telegram sends updates to
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Checked against X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '1'))
+
+    # Startup warm-up: connections, RAG pipeline and transcription model are readied before updates are served
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'True').lower() == 'true'
+    WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', '60'))  # Seconds per component before it is skipped
+
+    # Per-stage latency metrics in Prometheus text format, served on a local port (0 disables)
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))  # Webhook worker N listens on METRICS_PORT + N
+
+    # Event-loop lag sampling; stacks of callbacks blocking the loop longer than the threshold are logged
+    LOOP_MONITOR_ENABLED = os.getenv('LOOP_MONITOR_ENABLED', 'True').lower() == 'true'
+    LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.1'))  # Seconds between lag samples
+    LOOP_BLOCK_THRESHOLD = float(os.getenv('LOOP_BLOCK_THRESHOLD', '0.25'))  # Seconds of blocking that capture a stack
+
+    # FSM storage settings: "memory" (default), "sqlite" (single host) or "redis" (shared)
+    FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory').lower()
+    FSM_REDIS_URL = os.getenv('FSM_REDIS_URL', 'redis://localhost:6379/0')
+    FSM_SQLITE_PATH = os.getenv('FSM_SQLITE_PATH', os.path.join(os.path.dirname(__file__), '..', 'data', 'fsm_storage.sqlite3'))
+    FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', '86400'))  # Seconds before abandoned states expire, 0 disables
+
+    # Pagination/session store settings (quiz topics, time selection, materials)
+    PAGINATION_TTL = int(os.getenv('PAGINATION_TTL', '3600'))
+    PAGINATION_MAX_ENTRIES = int(os.getenv('PAGINATION_MAX_ENTRIES', '10000'))
+    PAGINATION_SQLITE_PATH = os.getenv('PAGINATION_SQLITE_PATH')  # Optional persistent tier
+
+    # Voice transcription settings: "cloud" (OpenAI whisper-1) or "local" (faster-whisper)
+    TRANSCRIPTION_BACKEND = os.getenv('TRANSCRIPTION_BACKEND', 'cloud').lower()
+    TRANSCRIPTION_LANGUAGE = os.getenv('TRANSCRIPTION_LANGUAGE', 'ru')
+    WHISPER_MODEL_SIZE = os.getenv('WHISPER_MODEL_SIZE', 'small')  # tiny, base, small, medium, large-v3
+    WHISPER_COMPUTE_TYPE = os.getenv('WHISPER_COMPUTE_TYPE', 'int8')
+    WHISPER_DEVICE = os.getenv('WHISPER_DEVICE', 'cpu')
+    WHISPER_WORKERS = int(os.getenv('WHISPER_WORKERS', '2'))  # Concurrent local transcriptions
+    WHISPER_CPU_THREADS = int(os.getenv('WHISPER_CPU_THREADS', '0'))  # 0 lets CTranslate2 decide
+    VOICE_MEMORY_LIMIT = int(os.getenv('VOICE_MEMORY_LIMIT', str(10 * 1024 * 1024)))  # Bytes kept in memory before spilling to disk
+
+    # Transcription cache keyed by Telegram file_unique_id
+    TRANSCRIPTION_CACHE_SIZE = int(os.getenv('TRANSCRIPTION_CACHE_SIZE', '5000'))  # Entries kept in memory
+    TRANSCRIPTION_CACHE_TTL = int(os.getenv('TRANSCRIPTION_CACHE_TTL', str(7 * 24 * 3600)))
+    TRANSCRIPTION_CACHE_PATH = os.getenv('TRANSCRIPTION_CACHE_PATH', os.path.join(os.path.dirname(__file__), '..', 'data', 'transcription_cache.sqlite3'))
+
+    # Voice activity detection before transcription (silence trimming)
+    VAD_ENABLED = os.getenv('VAD_ENABLED', 'True').lower() == 'true'
+    VAD_MARGIN_DB = float(os.getenv('VAD_MARGIN_DB', '12'))  # Speech must be this much louder than the noise floor
+    VAD_MIN_DB = float(os.getenv('VAD_MIN_DB', '-50'))  # Never treat frames quieter than this as speech
+    VAD_PADDING_MS = int(os.getenv('VAD_PADDING_MS', '210'))  # Kept around each speech region
+    VAD_MAX_PAUSE_MS = int(os.getenv('VAD_MAX_PAUSE_MS', '600'))  # Longer pauses are shortened to this
+
+    # Text-to-speech for users who prefer audio answers (see bot/services/elevenlabs.py for voice settings)
+    ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
+    AUDIO_DELIVERY_MODE = os.getenv('AUDIO_DELIVERY_MODE', 'text_first').lower()  # "text_first" (voice follows) or "voice"
+    TTS_STREAMING = os.getenv('TTS_STREAMING', 'True').lower() == 'true'  # Use the ElevenLabs streaming endpoint
+    TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'tts_cache'))
+    TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))  # Audio kept on disk
+    TTS_FILE_ID_TTL = int(os.getenv('TTS_FILE_ID_TTL', str(30 * 24 * 3600)))  # How long sent voice file_ids are reused
+
+    # Long audio is split at pauses and the chunks are transcribed concurrently
+    TRANSCRIPTION_CHUNK_SECONDS = float(os.getenv('TRANSCRIPTION_CHUNK_SECONDS', '60'))  # Max chunk length, 0 disables chunking
+    TRANSCRIPTION_CONCURRENCY = int(os.getenv('TRANSCRIPTION_CONCURRENCY', '4'))  # Chunks transcribed at the same time
+    TRANSCRIPTION_MAX_DURATION = int(os.getenv('TRANSCRIPTION_MAX_DURATION', '1200'))  # Seconds, 0 means unlimited
+    TRANSCRIPTION_MAX_DURATION_POLICY = os.getenv('TRANSCRIPTION_MAX_DURATION_POLICY', 'truncate').lower()  # "truncate" or "reject"
+
     # RAG Pipeline Prompt Template
 #    RAG_PROMPT_TEMPLATE = """
 #You are a system that reproduces the communicative style of a psychologist from broadcasts using ONLY the provided context. Language: Russian.
@@ -119,7 +194,13 @@ class Config:
             if not getattr(cls, var):
                 missing_vars.append(var)
         
+        if cls.BOT_MODE == 'webhook' and not cls.WEBHOOK_BASE_URL:
+            missing_vars.append('WEBHOOK_BASE_URL')
+
         if missing_vars:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
-        
+
+        if cls.BOT_MODE not in ('polling', 'webhook'):
+            raise ValueError(f"Unknown BOT_MODE '{cls.BOT_MODE}'. Use 'polling' or 'webhook'")
+
         return True
\ No newline at end of file
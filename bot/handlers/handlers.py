@@ -1,16 +1,23 @@
+import asyncio
 import logging
 import tempfile
+import time
 import os
 import json
-import time
+from typing import TYPE_CHECKING, Dict, Optional
 from aiogram import Router, types, F
 from aiogram.enums import ChatAction
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
-from bot.services.rag_pipeline import RAGPipeline
-from bot.services.elevenlabs import TextToSpeechService
+from bot.services.registry import ServiceRegistry
+from bot.services.transcription import AudioTooLongError, TranscriptionService
+from bot.services.tts_cache import TTSCache
 from bot.config import Config
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo, FSInputFile
-import openai
+from bot.utils.metrics import metrics, timed
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo, BufferedInputFile
+
+if TYPE_CHECKING:
+    from bot.services.elevenlabs import TextToSpeechService
 
 # Create routers for question handling
 question_router = Router()
@@ -51,40 +58,122 @@ def get_proper_title(content_type, original_title):
         logging.warning(f"Error getting proper title: {e}")
         return original_title
 
-# In-memory storage for pagination (in production, use Redis or database)
-user_pagination_data = {}
+async def transcribe_voice_cloud(message: types.Message, transcription_service: TranscriptionService) -> str:
+    """Transcribe voice message with the configured backend (local faster-whisper or OpenAI Whisper API)"""
+    media = message.voice or message.audio
+    language = Config.TRANSCRIPTION_LANGUAGE
+
+    # Forwarded or re-sent audio keeps its file_unique_id - skip download and transcription
+    cached_text = transcription_service.get_cached(media.file_unique_id, language)
+    if cached_text is not None:
+        logging.info(f"Transcription cache hit for {media.file_unique_id}")
+        return cached_text
+
+    # Reject over-long audio before downloading it (no-op unless the policy is "reject")
+    if media.duration:
+        transcription_service.check_duration(media.duration)
 
-async def transcribe_voice_cloud(message: types.Message) -> str:
-    """Transcribe voice message using OpenAI Whisper API"""
     # Get the file
-    file_id = message.voice.file_id if message.voice else message.audio.file_id
-    file = await message.bot.get_file(file_id)
+    file = await message.bot.get_file(media.file_id)
+    filename = os.path.basename(file.file_path or '') or 'voice.ogg'
     
-    temp_file = None
-    try:
-        with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as temp_file:
-            await message.bot.download_file(file.file_path, temp_file.name)
-            
-            # Use OpenAI Whisper API for transcription (v1.0+ syntax)
-            client = openai.AsyncOpenAI()
-            with open(temp_file.name, 'rb') as audio_file:
-                transcript = await client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="ru"
-                )
-            
-            return transcript.text.strip()
-            
-    finally:
-        # Clean up temp file
-        if temp_file and os.path.exists(temp_file.name):
-            os.unlink(temp_file.name)
+    # Audio stays in memory; only files above VOICE_MEMORY_LIMIT spill to a temp file
+    with tempfile.SpooledTemporaryFile(max_size=Config.VOICE_MEMORY_LIMIT) as audio_file:
+        await message.bot.download_file(file.file_path, destination=audio_file)
+        text = await transcription_service.transcribe(audio_file, language=language, filename=filename)
+
+    transcription_service.remember(media.file_unique_id, language, text)
+    return text
+
+
+async def send_voice_answer(message: types.Message, text: str, tts_service: "TextToSpeechService",
+                            tts_cache: Optional[TTSCache], keyboard: Optional[InlineKeyboardMarkup] = None):
+    """Send text as a voice message, reusing cached audio or an already uploaded file_id"""
+    request = tts_service.resolve_request(quality_preset="conversational")  # Good for bot responses
+    key = TTSCache.make_key(text, request) if tts_cache else None
+
+    file_id = tts_cache.get_file_id(key) if tts_cache else None
+    if file_id:
+        try:
+            return await message.answer_voice(voice=file_id, reply_markup=keyboard)
+        except TelegramBadRequest as e:
+            logging.warning(f"Cached voice file_id rejected, uploading again: {e}")
+            tts_cache.forget_file_id(key)
+
+    started = time.perf_counter()
+    timings = {}
+    audio_bytes = tts_cache.get_audio(key) if tts_cache else None
+    if audio_bytes is None:
+        # Generate OGG/Opus audio for voice messages, chunks are collected in memory as they arrive
+        with timed('tts.synthesis'):
+            audio_bytes = await tts_service.synthesize_long(
+                text=text,
+                quality_preset="conversational",
+                stream=Config.TTS_STREAMING,
+                timings=timings
+            )
+        if tts_cache:
+            tts_cache.put_audio(key, audio_bytes)
+
+    # Upload straight from memory as soon as the last chunk is in
+    audio_file = BufferedInputFile(audio_bytes, filename=f"response_{message.from_user.id}.ogg")
+    with timed('telegram.send_voice'):
+        sent = await message.answer_voice(voice=audio_file, reply_markup=keyboard)
+    upload_done = time.perf_counter() - started
+    if timings:
+        logging.info(
+            f"TTS timings: first byte {timings['first_byte'] * 1000:.0f} ms, "
+            f"last byte {timings['last_byte'] * 1000:.0f} ms, upload done {upload_done * 1000:.0f} ms "
+            f"({len(audio_bytes)} bytes)"
+        )
+    if tts_cache and sent.voice:
+        tts_cache.remember_file_id(key, sent.voice.file_id)
+    return sent
+
+
+# Background voice follow-ups by user id; a new question cancels the pending one
+voice_follow_ups: Dict[int, asyncio.Task] = {}
+
+
+def cancel_voice_follow_up(user_id: int):
+    """Cancel the voice follow-up still being prepared for a previous answer"""
+    task = voice_follow_ups.pop(user_id, None)
+    if task is not None and not task.done():
+        task.cancel()
+        logging.info(f"Cancelled pending voice follow-up for user {user_id}")
+
+
+def start_voice_follow_up(message: types.Message, text: str, tts_service: "TextToSpeechService",
+                          tts_cache: Optional[TTSCache]):
+    """Synthesize and send the answer as voice after the text answer was delivered"""
+    user_id = message.from_user.id
+
+    async def follow_up():
+        await send_voice_answer(message, text, tts_service, tts_cache)
+        logging.info(f"✅ Successfully sent voice follow-up to user {user_id}")
+
+    def on_done(task: asyncio.Task):
+        if voice_follow_ups.get(user_id) is task:
+            del voice_follow_ups[user_id]
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"⚠️ Voice follow-up failed for user {user_id}: {task.exception()}")
+
+    cancel_voice_follow_up(user_id)
+    task = asyncio.create_task(follow_up())
+    task.add_done_callback(on_done)
+    voice_follow_ups[user_id] = task
 
 
 @question_router.message(F.text | F.voice | F.audio)
-async def handle_user_question(message: types.Message, state: FSMContext, supabase_client):
+@timed('question.total')
+async def handle_user_question(message: types.Message, state: FSMContext, supabase_client, user,
+                               transcription_service: TranscriptionService,
+                               tts_service: Optional["TextToSpeechService"], tts_cache: Optional[TTSCache],
+                               services: ServiceRegistry):
     """Handle user questions with RAG pipeline"""
+    # The previous answer's voice is no longer wanted once a new question arrives
+    cancel_voice_follow_up(message.from_user.id)
+
     # Extract text from message (text or voice)
     user_text = None
     
@@ -95,13 +184,20 @@ async def handle_user_question(message: types.Message, state: FSMContext, supaba
         processing_voice_message = await message.answer("🎤 Распознаю голосовое сообщение...")
         
         try:
-            user_text = await transcribe_voice_cloud(message)
+            with timed('question.transcription'):
+                user_text = await transcribe_voice_cloud(message, transcription_service)
             await processing_voice_message.delete()
             
             if not user_text or user_text.strip() == "":
                 await message.answer("Не удалось распознать речь. Попробуйте еще раз или отправьте текстовое сообщение.")
                 return
                 
+        except AudioTooLongError as e:
+            logging.info(f"Rejected voice message: {e}")
+            await processing_voice_message.edit_text(
+                f"Сообщение слишком длинное. Максимальная длительность — {Config.TRANSCRIPTION_MAX_DURATION // 60} мин."
+            )
+            return
         except Exception as e:
             logging.error(f"Error transcribing voice: {e}")
             await processing_voice_message.edit_text("Ошибка при распознавании голосового сообщения. Попробуйте еще раз.")
@@ -120,21 +216,13 @@ async def handle_user_question(message: types.Message, state: FSMContext, supaba
     )
     
     try:
-        # Initialize RAG pipeline
-        rag = RAGPipeline(supabase_client)
+        # Shared RAG pipeline, created (and langchain imported) on the first question
+        rag = await services.get('rag_pipeline')
         
-        # Get user from database, create if doesn't exist
-        user = await supabase_client.get_user_by_telegram_id(message.from_user.id)
+        # User is resolved (or created) by UserContextMiddleware
         if not user:
-            # Try using create_or_update_user which might handle RLS better
-            user_data = {
-                'telegram_id': message.from_user.id,
-                'username': message.from_user.username
-            }
-            user = await supabase_client.create_or_update_user(user_data)
-            if not user:
-                await processing_message.edit_text("Для использования бота выполните команду /start")
-                return
+            await processing_message.edit_text("Для использования бота выполните команду /start")
+            return
         
         # Process question through RAG
         result = await rag.search_and_answer(
@@ -154,6 +242,7 @@ async def handle_user_question(message: types.Message, state: FSMContext, supaba
         
         # Create webapp buttons for sources
         keyboard = None
+        formatting_started = time.perf_counter()
 
         if result.get('sources'):
             
@@ -248,43 +337,16 @@ async def handle_user_question(message: types.Message, state: FSMContext, supaba
             
             keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
             logging.info(f"✅ RAG Step 5: Response Formatting - Created {len(buttons)} webapp buttons")
+        metrics.observe('question.formatting', time.perf_counter() - formatting_started)
         
         # Check if user prefers audio responses
-        if user.isAudio:
+        voice_follow_up = user.isAudio and tts_service is not None and Config.AUDIO_DELIVERY_MODE == 'text_first'
+        if user.isAudio and tts_service is not None and not voice_follow_up:
             try:
                 # Generate audio using ElevenLabs
                 logging.info(f"🎧 Generating audio response for user {message.from_user.id}")
-                tts_service = TextToSpeechService()
-                
-                # Generate audio file in OGG format for voice messages
-                audio_path = tts_service.text_to_speech(
-                    text=response_text,
-                    quality_preset="conversational",  # Good for bot responses
-                    output_filename=f"response_{message.from_user.id}_{int(time.time())}.ogg"
-                )
-                
-                # Send audio file
-                audio_file = FSInputFile(audio_path)
+                await send_voice_answer(message, response_text, tts_service, tts_cache, keyboard)
                 await processing_message.delete()  # Delete processing message
-                
-                if keyboard:
-                    # Send voice message with sources buttons
-                    await message.answer_voice(
-                        voice=audio_file,
-                        reply_markup=keyboard
-                    )
-                else:
-                    # Send voice message without buttons
-                    await message.answer_voice(
-                        voice=audio_file
-                    )
-                
-                # Clean up audio file
-                try:
-                    os.unlink(audio_path)
-                except OSError:
-                    pass  # File cleanup failed, but not critical
-                
                 logging.info(f"✅ Successfully sent audio response to user {message.from_user.id}")
                 return
                 
@@ -294,17 +356,23 @@ async def handle_user_question(message: types.Message, state: FSMContext, supaba
         
         # Send text response (either user prefers text or audio generation failed)
         logging.info(f"📤 RAG Step 5: Response Formatting - Sending final response (length: {len(response_text)} chars)")
-        try:
-            await processing_message.edit_text(response_text, reply_markup=keyboard, parse_mode="Markdown")
-            logging.info(f"✅ RAG Step 5: Response Formatting - Successfully sent response with Markdown")
-        except Exception as markdown_error:
-            # Fallback: send without markdown if parsing fails
-            logging.warning(f"⚠️ RAG Step 5: Response Formatting - Markdown parsing failed, sending as plain text: {markdown_error}")
-            await processing_message.edit_text(response_text, reply_markup=keyboard)
-            logging.info(f"✅ RAG Step 5: Response Formatting - Successfully sent response as plain text")
+        with timed('telegram.send_text'):
+            try:
+                await processing_message.edit_text(response_text, reply_markup=keyboard, parse_mode="Markdown")
+                logging.info(f"✅ RAG Step 5: Response Formatting - Successfully sent response with Markdown")
+            except Exception as markdown_error:
+                # Fallback: send without markdown if parsing fails
+                logging.warning(f"⚠️ RAG Step 5: Response Formatting - Markdown parsing failed, sending as plain text: {markdown_error}")
+                await processing_message.edit_text(response_text, reply_markup=keyboard)
+                logging.info(f"✅ RAG Step 5: Response Formatting - Successfully sent response as plain text")
+
+        if voice_follow_up:
+            # The text is already there, the voice version follows in the background
+            start_voice_follow_up(message, response_text, tts_service, tts_cache)
         
     except Exception as e:
         logging.error(f"❌ RAG Pipeline: Fatal error processing question for user {message.from_user.id}: {e}")
+        metrics.record_error('question.total')
         await processing_message.edit_text(
             "Произошла ошибка при обработке вашего вопроса. Попробуйте еще раз или обратитесь к администратору."
         )
@@ -1,9 +1,24 @@
 import asyncio
 import logging
+import multiprocessing
+import os
+from typing import Optional
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from bot.config import Config
 from bot.supabase_client import SupabaseClient
+from bot.services.fsm_storage import create_fsm_storage
+from bot.middlewares import UserContextMiddleware
+from bot.services.transcription import TranscriptionService
+from bot.services.elevenlabs import TextToSpeechService
+from bot.services.tts_cache import TTSCache
+from bot.services.static_assets import StaticAssetRegistry
+from bot.services.registry import ServiceRegistry
+from bot.services.warmup import Warmup
+from bot.utils.loop_monitor import LoopMonitor
+from bot.utils.metrics import MetricsServer
+from bot.utils.ttl_store import TTLStore
 from bot.commands.commands import start_router, content_router
 from bot.handlers.handlers import question_router, query_router
 from bot.callbacks.callbacks import callback_router
@@ -15,58 +30,276 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+ALLOWED_UPDATES = ['message', 'callback_query']
+
+def create_rag_pipeline(supabase_client: SupabaseClient):
+    """Import langchain/openai only when the pipeline is first needed"""
+    from bot.services.rag_pipeline import RAGPipeline
+    return RAGPipeline(supabase_client)
+
+def create_warmup(supabase_client: SupabaseClient, transcription_service: TranscriptionService,
+                  tts_service: Optional[TextToSpeechService], services: ServiceRegistry) -> Warmup:
+    """Startup warm-up so the first users don't pay for cold connections and model loading"""
+    warmup = Warmup(timeout=Config.WARMUP_TIMEOUT)
+    if not Config.WARMUP_ENABLED:
+        # The local whisper model is always loaded at startup
+        warmup.register('transcription', transcription_service.preload)
+        return warmup
+
+    warmup.register('supabase', supabase_client.ping)
+    warmup.register('transcription', transcription_service.warm_up)
+    if tts_service is not None:
+        warmup.register('elevenlabs', tts_service.get_account_info)
+
+    async def warm_up_rag():
+        # langchain is imported off the event loop; one tiny embedding call opens the
+        # OpenAI connection and a one-row search warms the vector index in Supabase
+        rag = await services.get('rag_pipeline')
+        embedding = await rag.get_embeddings("warm-up")
+        await supabase_client.search_content(user_id=0, query_embedding=embedding, limit=1)
+
+    warmup.register('rag', warm_up_rag)
+    return warmup
+
+def setup_metrics_server(dp: Dispatcher, worker_id: int = 0):
+    """Serve Prometheus metrics on a local port while the dispatcher is running"""
+    if not Config.METRICS_PORT:
+        return
+    server = MetricsServer(Config.METRICS_HOST, Config.METRICS_PORT + worker_id)
+    dp.startup.register(server.start)
+    dp.shutdown.register(server.stop)
+
+def create_dispatcher() -> Dispatcher:
+    """Create dispatcher with routers, dependencies and middlewares"""
+    dp = Dispatcher(storage=create_fsm_storage())
+
+    # Started first so blocking calls during warm-up are reported as well
+    loop_monitor = None
+    if Config.LOOP_MONITOR_ENABLED:
+        loop_monitor = LoopMonitor(interval=Config.LOOP_LAG_INTERVAL, threshold=Config.LOOP_BLOCK_THRESHOLD)
+        dp.startup.register(loop_monitor.start)
+        dp.shutdown.register(loop_monitor.stop)
+
+    # Initialize Supabase client
+    supabase_client = SupabaseClient(
+        supabase_url=Config.SUPABASE_URL,
+        supabase_key=Config.SUPABASE_KEY
+    )
+
+    # Transcription backend is shared by all handlers; a local model is loaded once at startup
+    transcription_cache = TTLStore(
+        'transcription',
+        max_entries=Config.TRANSCRIPTION_CACHE_SIZE,
+        ttl=Config.TRANSCRIPTION_CACHE_TTL,
+        sqlite_path=Config.TRANSCRIPTION_CACHE_PATH
+    )
+    transcription_service = TranscriptionService(cache=transcription_cache)
+
+    # One ElevenLabs client with pooled connections for all audio answers
+    try:
+        tts_service = TextToSpeechService(api_key=Config.ELEVENLABS_API_KEY)
+        dp.shutdown.register(tts_service.close)
+    except ValueError as e:
+        logging.warning(f"Text-to-speech disabled, audio answers will be sent as text: {e}")
+        tts_service = None
+
+    # Repeated answers reuse cached audio, or the file_id of the voice message already sent
+    tts_cache = None
+    if tts_service is not None:
+        tts_cache = TTSCache(
+            Config.TTS_CACHE_DIR,
+            max_bytes=Config.TTS_CACHE_MAX_BYTES,
+            file_ids=TTLStore(
+                'tts_file_id',
+                ttl=Config.TTS_FILE_ID_TTL,
+                sqlite_path=os.path.join(Config.TTS_CACHE_DIR, 'file_ids.sqlite3')
+            ),
+            audio_format=tts_service.audio_format
+        )
+
+    # Documents (vitamin book, PDF materials) are uploaded once and then sent by file_id
+    static_assets = StaticAssetRegistry(
+        TTLStore('static_assets', ttl=0, sqlite_path=Config.STATIC_ASSETS_PATH)
+    )
+
+    # Heavy services (langchain based RAG pipeline) are imported and built on first use
+    services = ServiceRegistry()
+    services.register('rag_pipeline', lambda: create_rag_pipeline(supabase_client))
+
+    # Polling runs it on startup; webhook workers run it in the background behind /ready
+    warmup = create_warmup(supabase_client, transcription_service, tts_service, services)
+
+    # Add dependency injection for supabase client and services
+    dp.workflow_data.update(
+        supabase_client=supabase_client,
+        transcription_service=transcription_service,
+        tts_service=tts_service,
+        tts_cache=tts_cache,
+        static_assets=static_assets,
+        services=services,
+        warmup=warmup,
+        loop_monitor=loop_monitor
+    )
+
+    # Include routers
+    dp.include_router(start_router)
+    dp.include_router(content_router)
+    dp.include_router(callback_router)
+    dp.include_router(question_router)
+    dp.include_router(query_router)
+
+    # Add middleware to inject supabase client
+    @dp.message.outer_middleware()
+    async def inject_supabase(handler, event, data):
+        data['supabase_client'] = supabase_client
+        return await handler(event, data)
+
+    @dp.callback_query.outer_middleware()
+    async def inject_supabase_callback(handler, event, data):
+        data['supabase_client'] = supabase_client
+        return await handler(event, data)
+
+    # Load the user profile once per update, only for handlers that ask for `user`
+    dp.message.middleware(UserContextMiddleware())
+    dp.callback_query.middleware(UserContextMiddleware())
+
+    return dp
+
 async def main():
-    """Main bot function"""
+    """Main bot function (long polling)"""
     try:
         # Validate configuration
         Config.validate()
         logger.info("Configuration validated successfully")
-        
+
         # Initialize bot and dispatcher
         bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
-        dp = Dispatcher(storage=MemoryStorage())
-        
-        # Initialize Supabase client
-        supabase_client = SupabaseClient(
-            supabase_url=Config.SUPABASE_URL,
-            supabase_key=Config.SUPABASE_KEY
-        )
-        
-        # Add dependency injection for supabase client
-        dp.workflow_data.update(supabase_client=supabase_client)
-        
-        # Include routers
-        dp.include_router(start_router)
-        dp.include_router(content_router)
-        dp.include_router(callback_router)
-        dp.include_router(question_router)
-        dp.include_router(query_router)
-        
-        # Add middleware to inject supabase client
-        @dp.message.outer_middleware()
-        async def inject_supabase(handler, event, data):
-            data['supabase_client'] = supabase_client
-            return await handler(event, data)
-        
-        @dp.callback_query.outer_middleware()
-        async def inject_supabase_callback(handler, event, data):
-            data['supabase_client'] = supabase_client
-            return await handler(event, data)
-        
+        dp = create_dispatcher()
+        setup_metrics_server(dp)
+        # Polling starts only after startup handlers, so the first updates hit warm services
+        dp.startup.register(dp.workflow_data['warmup'].run)
+
         logger.info("Bot initialized successfully")
-        
+
         # Start polling
-        await dp.start_polling(bot, allowed_updates=['message', 'callback_query'])
-        
+        await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES)
+
     except ValueError as e:
         logger.error(f"Configuration error: {e}")
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
 
+async def create_webhook_app(worker_id: int = 0) -> web.Application:
+    """Build aiohttp application serving Telegram webhook and health endpoints"""
+    bot = Bot(token=Config.TELEGRAM_BOT_TOKEN)
+    dp = create_dispatcher()
+    setup_metrics_server(dp, worker_id)
+    warmup: Warmup = dp.workflow_data['warmup']
+    app = web.Application()
+    status = {'ready': False}
+    background = {}
+
+    async def on_startup(bot: Bot):
+        # Only the first worker registers the webhook, the rest just serve requests
+        if worker_id == 0:
+            await bot.set_webhook(
+                url=f"{Config.WEBHOOK_BASE_URL.rstrip('/')}{Config.WEBHOOK_PATH}",
+                secret_token=Config.WEBHOOK_SECRET,
+                allowed_updates=ALLOWED_UPDATES
+            )
+            logger.info(f"Webhook registered at {Config.WEBHOOK_BASE_URL}{Config.WEBHOOK_PATH}")
+        status['ready'] = True
+        # aiohttp binds the port only after startup handlers return, so warming up here
+        # would leave the load balancer with refused connections instead of a 503 from /ready
+        background['warmup'] = asyncio.create_task(warmup.run())
+        logger.info(f"Webhook worker {worker_id} is serving, ready after warm-up")
+
+    async def on_shutdown():
+        status['ready'] = False
+        task = background.pop('warmup', None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
+    async def health(request: web.Request) -> web.Response:
+        """Liveness probe - process is up and serving HTTP"""
+        return web.json_response({'status': 'ok', 'worker': worker_id})
+
+    async def ready(request: web.Request) -> web.Response:
+        """Readiness probe - dispatcher started, warmed up and able to process updates"""
+        if not (status['ready'] and warmup.ready):
+            return web.json_response({'status': 'starting', 'worker': worker_id, 'warmup': warmup.status()}, status=503)
+        return web.json_response({'status': 'ready', 'worker': worker_id, 'warmup': warmup.status()})
+
+    app.router.add_get('/health', health)
+    app.router.add_get('/ready', ready)
+
+    # Telegram updates are acknowledged immediately and processed in background tasks
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=Config.WEBHOOK_SECRET
+    ).register(app, path=Config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    return app
+
+def run_webhook_worker(worker_id: int):
+    """Run a single webhook worker process"""
+    web.run_app(
+        create_webhook_app(worker_id),
+        host=Config.WEBHOOK_HOST,
+        port=Config.WEBHOOK_PORT,
+        reuse_port=Config.WEBHOOK_WORKERS > 1,
+        print=None
+    )
+
+def run_webhook():
+    """Run webhook server with Config.WEBHOOK_WORKERS processes sharing one port"""
+    try:
+        Config.validate()
+        logger.info("Configuration validated successfully")
+    except ValueError as e:
+        logger.error(f"Configuration error: {e}")
+        return
+
+    if not Config.WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET is not set - webhook requests will not be authenticated")
+
+    workers = max(1, Config.WEBHOOK_WORKERS)
+    if workers == 1:
+        run_webhook_worker(0)
+        return
+
+    # FSM state in worker memory is invisible to other workers, so multi-step flows would break
+    if Config.FSM_STORAGE == 'memory':
+        logger.warning("FSM_STORAGE=memory with several workers - use 'sqlite' or 'redis' to share FSM state")
+
+    processes = [
+        multiprocessing.Process(target=run_webhook_worker, args=(worker_id,), name=f"webhook-worker-{worker_id}")
+        for worker_id in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {workers} webhook workers on {Config.WEBHOOK_HOST}:{Config.WEBHOOK_PORT}")
+
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if Config.BOT_MODE == 'webhook':
+            run_webhook()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
\ No newline at end of file
+        logger.error(f"Unexpected error: {e}")
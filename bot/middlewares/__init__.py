@@ -0,0 +1,3 @@
+from .user_context import UserContextMiddleware
+
+__all__ = ['UserContextMiddleware']
@@ -0,0 +1,42 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiogram.types import User as TelegramUser
+from bot.supabase_client import SupabaseClient, User
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Resolve the database user once per update and inject it as `user`.
+
+    Registered as an inner middleware, so it runs after filters have picked the
+    handler and only queries the database when that handler declares a `user`
+    argument. Unknown users are created on first access.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        from_user = data.get('event_from_user')
+
+        if 'user' not in data and from_user and handler_object and 'user' in handler_object.params:
+            data['user'] = await self.resolve_user(data['supabase_client'], from_user)
+
+        return await handler(event, data)
+
+    @staticmethod
+    async def resolve_user(supabase_client: SupabaseClient, from_user: TelegramUser) -> Optional[User]:
+        """Fetch user by Telegram ID, creating the record if it doesn't exist"""
+        user = await supabase_client.get_user_by_telegram_id(from_user.id)
+        if user:
+            return user
+
+        user = await supabase_client.insert_user(telegram_id=from_user.id, username=from_user.username)
+        if not user:
+            logging.warning(f"Could not create user {from_user.id}")
+        return user
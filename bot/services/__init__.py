@@ -1,3 +1,9 @@
-from .rag_pipeline import RAGPipeline
+# RAGPipeline pulls in langchain and openai, so it is only imported when first used
+__all__ = ['RAGPipeline']
 
-__all__ = ['RAGPipeline']
\ No newline at end of file
+
+def __getattr__(name):
+    if name == 'RAGPipeline':
+        from .rag_pipeline import RAGPipeline
+        return RAGPipeline
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,191 @@
+import io
+import logging
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Tuple, Union
+import numpy as np
+from bot.config import Config
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+# Shortest chunk split_at_pauses makes on purpose, as a fraction of the chunk limit
+MIN_CHUNK_FRACTION = 0.25
+
+
+@dataclass
+class PreprocessedAudio:
+    """Decoded mono 16 kHz audio with silence trimmed and long pauses collapsed"""
+    samples: np.ndarray
+    original_duration: float
+    # Speech regions (start, end) in seconds on the timeline of `samples`
+    speech_segments: List[Tuple[float, float]] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / SAMPLE_RATE
+
+    @property
+    def seconds_saved(self) -> float:
+        return max(0.0, self.original_duration - self.duration)
+
+    def slice(self, start: float, end: float) -> "PreprocessedAudio":
+        """Part of the audio between `start` and `end` seconds, speech segments clipped to it"""
+        segments = [
+            (max(seg_start, start) - start, min(seg_end, end) - start)
+            for seg_start, seg_end in self.speech_segments
+            if seg_end > start and seg_start < end
+        ]
+        samples = self.samples[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+        return PreprocessedAudio(samples, len(samples) / SAMPLE_RATE, segments)
+
+    def to_ogg(self, bit_rate: int = 24000) -> io.BytesIO:
+        """Re-encode as in-memory Ogg/Opus for upload (a fraction of the size of PCM WAV)"""
+        import av
+
+        buffer = io.BytesIO()
+        pcm = (np.clip(self.samples, -1.0, 1.0) * 32767).astype(np.int16).reshape(1, -1)
+        with av.open(buffer, 'w', format='ogg') as container:
+            stream = container.add_stream('libopus', rate=SAMPLE_RATE)
+            stream.layout = 'mono'
+            stream.bit_rate = bit_rate
+            frame = av.AudioFrame.from_ndarray(pcm, format='s16', layout='mono')
+            frame.sample_rate = SAMPLE_RATE
+            for packet in stream.encode(frame):
+                container.mux(packet)
+            for packet in stream.encode(None):
+                container.mux(packet)
+        buffer.seek(0)
+        return buffer
+
+
+def decode_audio(audio: Union[str, BinaryIO]) -> np.ndarray:
+    """Decode any container/codec (Opus, MP3, M4A...) to mono float32 at 16 kHz"""
+    # faster-whisper ships a PyAV based decoder, imported lazily because it is heavy
+    from faster_whisper.audio import decode_audio as av_decode_audio
+    return av_decode_audio(audio, sampling_rate=SAMPLE_RATE)
+
+
+def detect_speech(samples: np.ndarray, margin_db: float, min_db: float, padding_ms: int) -> List[Tuple[int, int]]:
+    """
+    Energy based voice activity detection.
+
+    Frames louder than the noise floor (10th percentile of frame energy) plus
+    `margin_db` count as speech; speech regions are widened by `padding_ms`
+    so word onsets and endings are not clipped. Returns (start, end) sample ranges.
+    """
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    frame_count = len(samples) // frame
+    if frame_count == 0:
+        return []
+
+    frames = samples[:frame_count * frame].reshape(frame_count, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    threshold = max(np.percentile(energy_db, 10) + margin_db, min_db)
+    is_speech = energy_db > threshold
+
+    pad_frames = max(0, padding_ms // FRAME_MS)
+    if pad_frames:
+        is_speech = np.convolve(is_speech, np.ones(2 * pad_frames + 1), mode='same') > 0
+
+    edges = np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [(int(start) * frame, min(int(end) * frame, len(samples))) for start, end in zip(starts, ends)]
+
+
+def trim_silence(samples: np.ndarray, margin_db: float = None, min_db: float = None,
+                 padding_ms: int = None, max_pause_ms: int = None) -> PreprocessedAudio:
+    """Drop leading/trailing silence and shorten pauses longer than `max_pause_ms`"""
+    margin_db = Config.VAD_MARGIN_DB if margin_db is None else margin_db
+    min_db = Config.VAD_MIN_DB if min_db is None else min_db
+    padding_ms = Config.VAD_PADDING_MS if padding_ms is None else padding_ms
+    max_pause_ms = Config.VAD_MAX_PAUSE_MS if max_pause_ms is None else max_pause_ms
+
+    original_duration = len(samples) / SAMPLE_RATE
+    regions = detect_speech(samples, margin_db, min_db, padding_ms)
+    if not regions:
+        # Nothing stood out from the noise floor - let the recognizer decide
+        return PreprocessedAudio(samples, original_duration, [(0.0, original_duration)])
+
+    max_pause = SAMPLE_RATE * max_pause_ms // 1000
+    parts = []
+    speech_segments = []
+    position = 0
+    for index, (start, end) in enumerate(regions):
+        if index > 0:
+            gap_start = regions[index - 1][1]
+            if start - gap_start > max_pause:
+                # Keep the edges of a long pause, half on each side
+                half = max_pause // 2
+                parts.append(samples[gap_start:gap_start + half])
+                parts.append(samples[start - (max_pause - half):start])
+                position += max_pause
+            else:
+                parts.append(samples[gap_start:start])
+                position += start - gap_start
+        parts.append(samples[start:end])
+        speech_segments.append((position / SAMPLE_RATE, (position + end - start) / SAMPLE_RATE))
+        position += end - start
+
+    return PreprocessedAudio(np.concatenate(parts), original_duration, speech_segments)
+
+
+def split_at_pauses(audio: PreprocessedAudio, max_seconds: float,
+                    min_seconds: float = None) -> List[Tuple[float, float]]:
+    """
+    Split audio into ordered (start, end) chunks of at most `max_seconds`.
+
+    Each chunk ends at the point of a pause between speech segments nearest its
+    length limit, so no word is split. Cuts that would leave a chunk (or the final
+    remainder) shorter than `min_seconds` are avoided. Only when no pause fits is the
+    chunk cut at the limit; the short tail of the word then starts the next chunk
+    instead of becoming a chunk of its own. The silence of a pause that crosses
+    the limit is left out of both chunks.
+    """
+    duration = audio.duration
+    if max_seconds <= 0 or duration <= max_seconds:
+        return [(0.0, duration)]
+    if min_seconds is None:
+        min_seconds = max_seconds * MIN_CHUNK_FRACTION
+
+    pauses = [
+        (previous_end, start)
+        for (_, previous_end), (start, _) in zip(audio.speech_segments, audio.speech_segments[1:])
+    ]
+
+    chunks = []
+    chunk_start = 0.0
+    while duration - chunk_start > max_seconds:
+        limit = chunk_start + max_seconds
+        # (cut, next chunk start) for each pause: cut at its end, or at the limit if it falls inside
+        # the pause - the next chunk then starts at the pause end, so no chunk is only silence
+        cuts = [(min(pause_end, limit), pause_end) for pause_start, pause_end in pauses
+                if pause_start < limit and min(pause_end, limit) >= chunk_start + min_seconds]
+        # Prefer cuts that do not leave a sliver at the end of the audio
+        cuts = [cut for cut in cuts if duration - cut[1] >= min_seconds] or cuts
+        chunk_end, next_start = max(cuts) if cuts else (limit, limit)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = next_start
+    chunks.append((chunk_start, duration))
+    return chunks
+
+
+def preprocess_audio(audio: Union[str, BinaryIO], trim: bool = True) -> PreprocessedAudio:
+    """
+    Decode audio and find speech; CPU bound, run it off the event loop.
+
+    With `trim=False` the samples are left untouched and only the speech
+    segments are detected (used to find pauses for chunking).
+    """
+    samples = decode_audio(audio)
+    if not trim:
+        duration = len(samples) / SAMPLE_RATE
+        regions = detect_speech(samples, Config.VAD_MARGIN_DB, Config.VAD_MIN_DB, Config.VAD_PADDING_MS)
+        segments = [(start / SAMPLE_RATE, end / SAMPLE_RATE) for start, end in regions] or [(0.0, duration)]
+        return PreprocessedAudio(samples, duration, segments)
+
+    processed = trim_silence(samples)
+    logging.info(
+        f"VAD: {processed.original_duration:.1f}s -> {processed.duration:.1f}s "
+        f"({processed.seconds_saved:.1f}s of silence removed)"
+    )
+    return processed
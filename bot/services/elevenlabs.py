@@ -5,23 +5,75 @@ All functionality in a single file
 """
 
 import argparse
+import asyncio
+import logging
+import math
 import sys
 import os
-import requests
+import aiohttp
 import time
 import re
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import Optional, Dict, List
+from typing import Callable, Optional, Dict, List, Tuple
 from dotenv import load_dotenv
+from bot.utils.metrics import queued, timed
+from bot.utils.ogg import concat_opus
 
-# Load environment variables
-load_dotenv()
+MAX_REQUEST_CHARS = 5000  # ElevenLabs limit per request
+
+
+def parse_retry_after(value: Optional[str], default: float) -> float:
+    """Seconds to wait from a Retry-After header (delay in seconds or an HTTP date), else `default`"""
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+        return max(0.0, seconds) if math.isfinite(seconds) else default
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """Split text at sentence boundaries into chunks of at most `max_chars` characters"""
+    sentences = [s for s in re.split(r'(?<=[.!?…])\s+|\n+', text.strip()) if s.strip()]
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        # A sentence longer than the limit is split at word boundaries
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
 
 
 class TextToSpeechService:
     """
     A service for converting text to speech using ElevenLabs API
+
+    Requests go through one aiohttp session with keep-alive connections, so the
+    service should be created once and shared; call `close()` on shutdown.
     """
+
+    # Status codes worth retrying: rate limiting and transient server errors
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    STREAM_CHUNK_SIZE = 16 * 1024
     
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or os.getenv('ELEVENLABS_API_KEY')
@@ -33,8 +85,12 @@ class TextToSpeechService:
         self.default_model = os.getenv('MODEL', 'eleven_monolingual_v1')
         self.output_dir = Path(os.getenv('OUTPUT_DIR', 'output'))
         self.audio_format = os.getenv('AUDIO_FORMAT', 'ogg')  # Default to OGG for Telegram voice messages
-        
-        self.output_dir.mkdir(exist_ok=True)
+        self.timeout = float(os.getenv('ELEVENLABS_TIMEOUT', '30'))  # Seconds per request attempt
+        self.max_retries = int(os.getenv('ELEVENLABS_MAX_RETRIES', '2'))
+        self.max_connections = int(os.getenv('ELEVENLABS_MAX_CONNECTIONS', '10'))
+        self.chunk_chars = min(int(os.getenv('ELEVENLABS_CHUNK_CHARS', '1000')), MAX_REQUEST_CHARS)  # Longer texts are split
+        self._semaphore = asyncio.Semaphore(int(os.getenv('ELEVENLABS_CONCURRENCY', '3')))  # Parallel chunk requests
+        self._session: Optional[aiohttp.ClientSession] = None
         
         self.headers = {
             "Accept": "audio/mpeg",
@@ -43,6 +99,74 @@ class TextToSpeechService:
         }
     
 
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, headers={"xi-api-key": self.api_key})
+        return self._session
+
+    async def close(self):
+        """Close pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @timed('elevenlabs.request')
+    async def _request(self, method: str, url: str, timeout: Optional[float] = None,
+                       on_chunk: Optional[Callable[[bytes], None]] = None, **kwargs) -> bytes:
+        """
+        Send a request with retries on timeouts, connection errors, 429 and 5xx.
+
+        With `on_chunk` the body is read as a stream and every chunk is passed to
+        the callback as it arrives; `timeout` then limits the wait for each chunk
+        rather than the whole response, and a stream that already delivered data
+        is not retried.
+        """
+        if on_chunk is None:
+            client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        else:
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout or self.timeout, sock_read=timeout or self.timeout)
+        received = False
+        for attempt in range(self.max_retries + 1):
+            retry_after = 2 ** attempt * 0.5
+            try:
+                async with self._get_session().request(method, url, timeout=client_timeout, **kwargs) as response:
+                    if response.status == 401:
+                        raise Exception("Authentication failed. Please check your API key")
+                    elif response.status == 402:
+                        raise Exception("Insufficient quota. Please check your account balance")
+                    elif response.status == 422:
+                        raise ValueError("Invalid request parameters")
+                    elif response.status in self.RETRY_STATUSES:
+                        if response.status == 429:
+                            retry_after = parse_retry_after(response.headers.get('Retry-After'), retry_after)
+                        if attempt < self.max_retries:
+                            logging.warning(f"ElevenLabs returned {response.status}, retrying in {retry_after:.1f}s")
+                            await asyncio.sleep(retry_after)
+                            continue
+                        if response.status == 429:
+                            raise Exception("Rate limit exceeded. Please try again later")
+                    response.raise_for_status()
+                    if on_chunk is None:
+                        return await response.read()
+                    chunks = []
+                    async for chunk in response.content.iter_chunked(self.STREAM_CHUNK_SIZE):
+                        received = True
+                        on_chunk(chunk)
+                        chunks.append(chunk)
+                    return b"".join(chunks)
+            except asyncio.TimeoutError:
+                if attempt >= self.max_retries or received:
+                    raise Exception("Request timed out. Please try again")
+            except aiohttp.ClientConnectionError:
+                if attempt >= self.max_retries or received:
+                    raise Exception("Connection error. Please check your internet connection")
+            except aiohttp.ClientResponseError as e:
+                raise Exception(f"Failed to generate speech: {str(e)}")
+            logging.warning(f"ElevenLabs request failed, retrying in {retry_after:.1f}s")
+            await asyncio.sleep(retry_after)
+
     def get_audio_quality_presets(self) -> Dict[str, Dict]:
         return {
             "podcast": {"stability": 0.7, "similarity_boost": 0.8, "style": 0.1, "use_speaker_boost": True, "description": "Optimized for podcast narration"},
@@ -79,18 +203,9 @@ class TextToSpeechService:
         sanitized = re.sub(r'[<>:"/\\|?*]', '_', filename).strip(' .')
         return sanitized if sanitized else f"speech_{int(time.time())}"
     
-    def text_to_speech(self, text: str, voice_id: Optional[str] = None, model: Optional[str] = None, 
-                      voice_settings: Optional[Dict] = None, quality_preset: Optional[str] = None, 
-                      output_filename: Optional[str] = None) -> str:
-        # Input validation
-        if not isinstance(text, str) or not text.strip():
-            raise ValueError("Text cannot be empty")
-        if len(text) > 5000:
-            raise ValueError("Text too long (max 5000 characters)")
-        
-        voice_id = voice_id or self.default_voice_id
-        model = model or self.default_model
-        
+    def resolve_request(self, voice_id: Optional[str] = None, model: Optional[str] = None,
+                        voice_settings: Optional[Dict] = None, quality_preset: Optional[str] = None) -> Dict:
+        """Fill in defaults and validate; the result fully determines the generated audio (with the text)"""
         if quality_preset:
             voice_settings = self.apply_quality_preset(quality_preset)
         elif voice_settings is None:
@@ -98,61 +213,123 @@ class TextToSpeechService:
         
         self._validate_voice_settings(voice_settings)
         
+        return {
+            "voice_id": voice_id or self.default_voice_id,
+            "model_id": model or self.default_model,
+            "voice_settings": voice_settings,
+            # OGG/OPUS for Telegram voice messages, otherwise the API default (MP3)
+            "output_format": "opus_48000_64" if self.audio_format == "ogg" else None
+        }
+    
+    async def synthesize(self, text: str, voice_id: Optional[str] = None, model: Optional[str] = None,
+                         voice_settings: Optional[Dict] = None, quality_preset: Optional[str] = None,
+                         timeout: Optional[float] = None, stream: bool = False,
+                         timings: Optional[Dict[str, float]] = None) -> bytes:
+        """
+        Generate speech and return the audio bytes without touching the disk.
+
+        `stream=True` uses the streaming endpoint, which starts sending audio
+        before synthesis of the whole text is finished. When a `timings` dict is
+        given, seconds until the first and last byte are recorded in it.
+        """
+        # Input validation
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("Text cannot be empty")
+        if len(text) > MAX_REQUEST_CHARS:
+            raise ValueError(f"Text too long (max {MAX_REQUEST_CHARS} characters), use synthesize_long")
+        
+        request = self.resolve_request(voice_id, model, voice_settings, quality_preset)
+        data = {"text": text, "model_id": request["model_id"], "voice_settings": request["voice_settings"]}
+        
+        url = f"{self.base_url}/text-to-speech/{request['voice_id']}"
+        if stream:
+            url += "/stream"
+        if request["output_format"]:
+            url += f"?output_format={request['output_format']}"
+        
+        started = time.perf_counter()
+        on_chunk = None
+        if stream:
+            def on_chunk(chunk: bytes):
+                if timings is not None:
+                    timings.setdefault('first_byte', time.perf_counter() - started)
+        audio = await self._request("POST", url, json=data, headers=self.headers, timeout=timeout, on_chunk=on_chunk)
+        if timings is not None:
+            timings.setdefault('first_byte', time.perf_counter() - started)
+            timings['last_byte'] = time.perf_counter() - started
+        
+        if len(audio) == 0:
+            raise Exception("Received empty audio data")
+        
+        return audio
+    
+    async def synthesize_long(self, text: str, voice_id: Optional[str] = None, model: Optional[str] = None,
+                              voice_settings: Optional[Dict] = None, quality_preset: Optional[str] = None,
+                              stream: bool = False, timings: Optional[Dict[str, float]] = None) -> bytes:
+        """
+        Generate speech for text of any length.
+
+        Text longer than `chunk_chars` is split at sentence boundaries, the chunks
+        are synthesized concurrently (at most ELEVENLABS_CONCURRENCY requests at
+        a time) and the audio is joined without re-encoding.
+        """
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError("Text cannot be empty")
+        chunks = split_text(text, self.chunk_chars) if len(text) > self.chunk_chars else [text]
+
+        async def synthesize_chunk(chunk: str) -> Tuple[bytes, Dict[str, float]]:
+            chunk_timings = {}
+            async with queued('elevenlabs', self._semaphore):
+                audio = await self.synthesize(chunk, voice_id=voice_id, model=model, voice_settings=voice_settings,
+                                              quality_preset=quality_preset, stream=stream, timings=chunk_timings)
+            return audio, chunk_timings
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(synthesize_chunk(chunk) for chunk in chunks))
+        if timings is not None:
+            # The first chunk is what the listener hears first
+            timings['first_byte'] = results[0][1]['first_byte']
+            timings['last_byte'] = time.perf_counter() - started
+        if len(results) == 1:
+            return results[0][0]
+
+        logging.info(f"Synthesized {len(text)} characters in {len(chunks)} parallel chunks")
+        parts = [audio for audio, _ in results]
+        if self.audio_format == "ogg":
+            # CRC computation is CPU bound, keep it off the event loop
+            return await asyncio.to_thread(concat_opus, parts)
+        # MP3 frames are self-contained, plain concatenation plays back fine
+        return b"".join(parts)
+    
+    async def text_to_speech(self, text: str, voice_id: Optional[str] = None, model: Optional[str] = None, 
+                             voice_settings: Optional[Dict] = None, quality_preset: Optional[str] = None, 
+                             output_filename: Optional[str] = None) -> str:
+        """Generate speech and save it to output_dir, returns the file path"""
+        audio = await self.synthesize_long(text, voice_id=voice_id, model=model,
+                                           voice_settings=voice_settings, quality_preset=quality_preset)
+        
         if output_filename is None:
             output_filename = f"speech_{int(time.time())}.{self.audio_format}"
         output_filename = self._sanitize_filename(output_filename)
         if not output_filename.endswith(f'.{self.audio_format}'):
             output_filename += f'.{self.audio_format}'
         
+        self.output_dir.mkdir(exist_ok=True)
         output_path = self.output_dir / output_filename
         
-        data = {"text": text, "model_id": model, "voice_settings": voice_settings}
-        
-        try:
-            url = f"{self.base_url}/text-to-speech/{voice_id}"
-            # Add output format as query parameter for OGG/OPUS
-            if self.audio_format == "ogg":
-                url += "?output_format=opus_48000_64"
-            response = requests.post(url, json=data, headers=self.headers, timeout=30)
-            
-            if response.status_code == 401:
-                raise Exception("Authentication failed. Please check your API key")
-            elif response.status_code == 402:
-                raise Exception("Insufficient quota. Please check your account balance")
-            elif response.status_code == 422:
-                raise ValueError("Invalid request parameters")
-            elif response.status_code == 429:
-                raise Exception("Rate limit exceeded. Please try again later")
-            
-            response.raise_for_status()
-            
-            if len(response.content) == 0:
-                raise Exception("Received empty audio data")
-            
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            
-            if not output_path.exists() or output_path.stat().st_size == 0:
-                raise Exception("Audio file was not created successfully")
-            
-            print(f"Audio saved to: {output_path}")
-            return str(output_path)
+        with open(output_path, 'wb') as f:
+            f.write(audio)
         
-        except requests.exceptions.Timeout:
-            raise Exception("Request timed out. Please try again")
-        except requests.exceptions.ConnectionError:
-            raise Exception("Connection error. Please check your internet connection")
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Failed to generate speech: {str(e)}")
+        print(f"Audio saved to: {output_path}")
+        return str(output_path)
     
-    def get_account_info(self) -> Dict:
+    async def get_account_info(self) -> Dict:
         try:
-            url = f"{self.base_url}/user"
-            headers = {"xi-api-key": self.api_key}
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            async with self._get_session().get(f"{self.base_url}/user",
+                                               timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                response.raise_for_status()
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             raise Exception(f"Failed to get account info: {str(e)}")
     
     def estimate_cost(self, text: str) -> Dict:
@@ -165,6 +342,9 @@ class TextToSpeechService:
 
 
 def main():
+    # Load environment variables (the bot loads them in bot.config)
+    load_dotenv()
+
     parser = argparse.ArgumentParser(
         description='Convert text to speech using ElevenLabs API',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -205,7 +385,11 @@ Examples:
     parser.add_argument('--estimate-cost', action='store_true', help='Estimate cost')
     
     args = parser.parse_args()
-    
+    asyncio.run(run_cli(parser, args))
+
+
+async def run_cli(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    tts_service = None
     try:
         tts_service = TextToSpeechService()
         
@@ -224,7 +408,7 @@ Examples:
         if args.account_info:
             print("Account Information:")
             print("-" * 30)
-            info = tts_service.get_account_info()
+            info = await tts_service.get_account_info()
             print(f"User ID: {info.get('user_id', 'N/A')}")
             subscription = info.get('subscription', {})
             print(f"Subscription: {subscription.get('tier', 'N/A')}")
@@ -274,7 +458,7 @@ Examples:
         if args.quality_preset:
             print(f"Using quality preset: {args.quality_preset}")
         
-        output_path = tts_service.text_to_speech(
+        output_path = await tts_service.text_to_speech(
             text=text,
             voice_id=voice_id,
             model=args.model,
@@ -293,6 +477,9 @@ Examples:
     except Exception as e:
         print(f"Unexpected error: {e}")
         sys.exit(1)
+    finally:
+        if tts_service is not None:
+            await tts_service.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Mapping, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from bot.config import Config
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage backed by a local SQLite file.
+
+    Survives restarts and can be shared by several processes on the same host
+    (WAL mode). Records expire `ttl` seconds after their last write.
+    Queries hit a single indexed row, so they run inline on the event loop -
+    handing them to a thread would cost more than the query itself. A write
+    waiting for another process's lock would stall the loop, so the busy timeout
+    is kept short instead of sqlite's default 5 s.
+    """
+
+    PURGE_EVERY_WRITES = 1000
+    # Seconds a write waits for another process's lock (writes take well under a millisecond)
+    BUSY_TIMEOUT = 0.2
+    # An expired row being rewritten must not resurrect its other column
+    EXPIRED = "fsm_storage.expires_at IS NOT NULL AND fsm_storage.expires_at <= ?"
+
+    def __init__(self, path: str, ttl: Optional[int] = None):
+        self.path = path
+        self.ttl = ttl or None
+        self._writes = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS fsm_storage ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}', expires_at REAL)"
+        )
+
+    @staticmethod
+    def _build_key(key: StorageKey) -> str:
+        parts = [str(key.bot_id)]
+        if key.business_connection_id:
+            parts.append(str(key.business_connection_id))
+        parts.append(str(key.chat_id))
+        if key.thread_id:
+            parts.append(str(key.thread_id))
+        parts.extend([str(key.user_id), key.destiny])
+        return ":".join(parts)
+
+    def _expires_at(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl else None
+
+    def _after_write(self, key: str):
+        # Drop records that no longer hold anything, so finished flows do not pile up
+        self.connection.execute(
+            "DELETE FROM fsm_storage WHERE key = ? AND state IS NULL AND data = '{}'", (key,)
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY_WRITES == 0:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Delete expired records, returns number of removed rows"""
+        cursor = self.connection.execute(
+            "DELETE FROM fsm_storage WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def _fetch(self, key: str, column: str) -> Optional[str]:
+        row = self.connection.execute(
+            f"SELECT {column} FROM fsm_storage WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        db_key = self._build_key(key)
+        state_value = state.state if isinstance(state, State) else state
+        self.connection.execute(
+            "INSERT INTO fsm_storage (key, state, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state, "
+            f"data = CASE WHEN {self.EXPIRED} THEN '{{}}' ELSE fsm_storage.data END, "
+            "expires_at = excluded.expires_at",
+            (db_key, state_value, self._expires_at(), time.time())
+        )
+        self._after_write(db_key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._fetch(self._build_key(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        db_key = self._build_key(key)
+        self.connection.execute(
+            "INSERT INTO fsm_storage (key, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data, "
+            f"state = CASE WHEN {self.EXPIRED} THEN NULL ELSE fsm_storage.state END, "
+            "expires_at = excluded.expires_at",
+            (db_key, json.dumps(dict(data), ensure_ascii=False), self._expires_at(), time.time())
+        )
+        self._after_write(db_key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        raw = self._fetch(self._build_key(key), "data")
+        return json.loads(raw) if raw else {}
+
+    async def close(self) -> None:
+        self.connection.close()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Create FSM storage selected by Config.FSM_STORAGE"""
+    backend = Config.FSM_STORAGE
+    ttl = Config.FSM_STATE_TTL or None
+
+    if backend == 'redis':
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise ValueError("FSM_STORAGE=redis requires the 'redis' package to be installed")
+        logging.info(f"Using Redis FSM storage at {Config.FSM_REDIS_URL} (ttl: {ttl})")
+        return RedisStorage.from_url(Config.FSM_REDIS_URL, state_ttl=ttl, data_ttl=ttl)
+
+    if backend == 'sqlite':
+        logging.info(f"Using SQLite FSM storage at {Config.FSM_SQLITE_PATH} (ttl: {ttl})")
+        return SQLiteStorage(Config.FSM_SQLITE_PATH, ttl=ttl)
+
+    if backend != 'memory':
+        raise ValueError(f"Unknown FSM_STORAGE '{backend}'. Use 'memory', 'sqlite' or 'redis'")
+    return MemoryStorage()
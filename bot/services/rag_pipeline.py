@@ -3,6 +3,7 @@ from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.prompts import PromptTemplate
 from bot.config import Config
 from bot.supabase_client import SupabaseClient
+from bot.utils.metrics import timed
 import logging
 
 class RAGPipeline:
@@ -24,11 +25,13 @@ class RAGPipeline:
             input_variables=["context", "question"]
         )
     
+    @timed('rag.embedding')
     async def get_embeddings(self, text: str) -> List[float]:
         """Generate embeddings for given text"""
         embeddings = await self.embeddings.aembed_query(text)
         return embeddings
     
+    @timed('rag.total')
     async def search_and_answer(self, user_id: int, question: str, user_settings: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Main RAG pipeline: search content and generate answer
@@ -48,11 +51,12 @@ class RAGPipeline:
         search_limit = Config.SEARCH_LIMIT
             
         # Search in user's content
-        search_results = await self.supabase_client.search_content(
-            user_id=user_id,
-            query_embedding=query_embeddings,
-            limit=search_limit
-        )
+        with timed('rag.search'):
+            search_results = await self.supabase_client.search_content(
+                user_id=user_id,
+                query_embedding=query_embeddings,
+                limit=search_limit
+            )
             
         # Prepare context for LLM
         context_parts = []
@@ -73,7 +77,8 @@ class RAGPipeline:
 
         pass  # Prompt debugging removed for performance
             
-        response = await self.llm.ainvoke([{"role": "user", "content": prompt}])
+        with timed('rag.llm'):
+            response = await self.llm.ainvoke([{"role": "user", "content": prompt}])
         answer = response.content.strip()
             
         result = {
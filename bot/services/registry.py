@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict
+
+
+class ServiceRegistry:
+    """
+    Services created on first use.
+
+    Factories are registered at startup and only run (importing their heavy
+    dependencies, e.g. langchain for the RAG pipeline) when a handler first asks
+    for the service; the instance is then shared by all later requests.
+    Factories run in a worker thread so the event loop keeps serving updates,
+    and concurrent first requests wait for the same load instead of each
+    building the service.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.load_times: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+
+    async def get(self, name: str) -> Any:
+        """Return the service, creating it on first access"""
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._factories:
+            raise KeyError(f"Service '{name}' is not registered")
+        if name not in self._loading:
+            self._loading[name] = asyncio.ensure_future(self._load(name))
+        # A caller that gives up (e.g. a warm-up timeout) does not cancel the load for the others
+        return await asyncio.shield(self._loading[name])
+
+    async def _load(self, name: str) -> Any:
+        started = time.perf_counter()
+        try:
+            instance = await asyncio.to_thread(self._factories[name])
+        finally:
+            # On failure the next request tries again
+            del self._loading[name]
+        self._instances[name] = instance
+        self.load_times[name] = time.perf_counter() - started
+        logging.info(f"Service '{name}' loaded in {self.load_times[name] * 1000:.0f} ms")
+        return instance
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
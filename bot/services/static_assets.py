@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import os
+from typing import Dict
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+from bot.utils.files import FileHashCache
+from bot.utils.ttl_store import TTLStore
+
+
+class StaticAssetRegistry:
+    """
+    Upload-once registry for files the bot sends repeatedly (the vitamin book, PDF materials).
+
+    The first send uploads the file and stores the Telegram file_id, keyed by the
+    SHA-256 of the content and the file name; later sends reuse the file_id.
+    Editing the file changes its hash, so the new version is uploaded once again.
+    Hashes are cached by (mtime, size) so unchanged files are not re-read.
+    """
+
+    def __init__(self, store: TTLStore):
+        self.store = store
+        self.stats = {'uploads': 0, 'file_id_sends': 0, 'reuploads': 0}
+        self._hashes = FileHashCache()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def asset_key(self, path: str) -> str:
+        """Content hash and file name of the current version of the file"""
+        digest = await self._hashes.digest_async(path)
+        return f"{digest}:{os.path.basename(path)}"
+
+    async def send_document(self, bot: Bot, chat_id: int, path: str, **kwargs) -> Message:
+        """Send a file as a document by its cached file_id, uploading it only the first time"""
+        key = await self.asset_key(path)
+        file_id = self.store.get(key)
+        if file_id is None:
+            # Concurrent first sends of the same file wait for one upload instead of each uploading
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                file_id = self.store.get(key)
+                if file_id is None:
+                    return await self._upload(bot, chat_id, path, key, **kwargs)
+
+        try:
+            message = await bot.send_document(chat_id, document=file_id, **kwargs)
+            self.stats['file_id_sends'] += 1
+            return message
+        except TelegramBadRequest as e:
+            logging.warning(f"Stored file_id for {os.path.basename(path)} rejected, uploading again: {e}")
+            self.store.pop(key)
+            self.stats['reuploads'] += 1
+            return await self._upload(bot, chat_id, path, key, **kwargs)
+
+    async def _upload(self, bot: Bot, chat_id: int, path: str, key: str, **kwargs) -> Message:
+        message = await bot.send_document(chat_id, document=FSInputFile(path), **kwargs)
+        self.stats['uploads'] += 1
+        if message.document:
+            self.store.set(key, message.document.file_id)
+            logging.info(f"Uploaded {os.path.basename(path)}, file_id stored for reuse")
+        return message
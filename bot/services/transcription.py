@@ -1,7 +1,17 @@
-import openai
+import asyncio
+import numpy as np
 from bot.config import Config
+from bot.utils.metrics import queued, timed
+from bot.utils.ttl_store import TTLStore
+from bot.services.audio_preprocessing import PreprocessedAudio, preprocess_audio, split_at_pauses
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Optional, Union
 import logging
 import os
+import time
+
+if TYPE_CHECKING:
+    import openai
 
 async def transcribe_audio(audio_file_path: str) -> str:
     """
@@ -13,6 +23,8 @@ async def transcribe_audio(audio_file_path: str) -> str:
     Returns:
         Transcribed text or empty string if failed
     """
+    import openai  # Heavy import, only needed when transcribing
+
     try:
         if not os.path.exists(audio_file_path):
             logging.error(f"Audio file not found: {audio_file_path}")
@@ -49,6 +61,8 @@ async def transcribe_audio_with_language(audio_file_path: str, language: str = N
     Returns:
         Dict with transcription, language, and other metadata
     """
+    import openai  # Heavy import, only needed when transcribing
+
     try:
         if not os.path.exists(audio_file_path):
             logging.error(f"Audio file not found: {audio_file_path}")
@@ -85,4 +99,214 @@ async def transcribe_audio_with_language(audio_file_path: str, language: str = N
         return {"text": "", "language": "unknown", "confidence": 0.0}
     except Exception as e:
         logging.error(f"Error in detailed transcription: {e}")
-        return {"text": "", "language": "unknown", "confidence": 0.0}
\ No newline at end of file
+        return {"text": "", "language": "unknown", "confidence": 0.0}
+
+_cloud_client: Optional["openai.AsyncOpenAI"] = None
+
+
+def get_cloud_client() -> "openai.AsyncOpenAI":
+    """Shared async OpenAI client, so connections are reused between transcriptions"""
+    global _cloud_client
+    if _cloud_client is None:
+        import openai  # Heavy import, deferred until the first cloud transcription
+        _cloud_client = openai.AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
+    return _cloud_client
+
+
+@timed('openai.transcription')
+async def transcribe_cloud(audio_file: BinaryIO, language: Optional[str] = None, filename: str = "voice.ogg") -> str:
+    """Transcribe an in-memory or on-disk audio file object with OpenAI whisper-1"""
+    # The API detects the audio format from the file name extension
+    params = {"model": "whisper-1", "file": (filename, audio_file)}
+    if language:
+        params["language"] = language
+    transcript = await get_cloud_client().audio.transcriptions.create(**params)
+    return transcript.text.strip()
+
+
+class LocalWhisperTranscriber:
+    """
+    faster-whisper (CTranslate2) model loaded once and shared by all requests.
+
+    Inference runs in a thread pool: CTranslate2 releases the GIL while decoding,
+    so threads give real parallelism without loading a model copy per process.
+    """
+
+    def __init__(self, model_size: str, compute_type: str = 'int8', device: str = 'cpu',
+                 workers: int = 1, cpu_threads: int = 0):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.device = device
+        self.workers = max(1, workers)
+        self.cpu_threads = cpu_threads
+        self.model = None
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='whisper')
+        self._load_lock = asyncio.Lock()
+
+    def _load(self):
+        from faster_whisper import WhisperModel
+
+        started = time.perf_counter()
+        self.model = WhisperModel(
+            self.model_size,
+            device=self.device,
+            compute_type=self.compute_type,
+            cpu_threads=self.cpu_threads,
+            num_workers=self.workers
+        )
+        logging.info(f"Loaded faster-whisper '{self.model_size}' ({self.compute_type}) in {time.perf_counter() - started:.1f}s")
+
+    async def load(self):
+        """Load the model off the event loop (no-op if already loaded)"""
+        async with self._load_lock:
+            if self.model is None:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+
+    def _transcribe_sync(self, audio: Union[str, BinaryIO, np.ndarray], language: Optional[str]) -> str:
+        segments, _ = self.model.transcribe(audio, language=language, beam_size=1)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    @timed('whisper.local')
+    async def transcribe(self, audio: Union[str, BinaryIO, np.ndarray], language: Optional[str] = None) -> str:
+        """Transcribe a file path, file object or 16 kHz samples without blocking the event loop"""
+        await self.load()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._transcribe_sync, audio, language
+        )
+
+
+class AudioTooLongError(ValueError):
+    """Audio is longer than TRANSCRIPTION_MAX_DURATION and the policy is to reject it"""
+
+
+class TranscriptionService:
+    """Transcribe audio with the configured backend, falling back to the cloud API"""
+
+    def __init__(self, backend: Optional[str] = None, cache: Optional[TTLStore] = None):
+        self.backend = backend or Config.TRANSCRIPTION_BACKEND
+        self.cache = cache
+        self.local = None
+        self.stats = {'requests': 0, 'audio_seconds': 0.0, 'audio_seconds_saved': 0.0, 'chunks': 0}
+        self._chunk_semaphore = asyncio.Semaphore(max(1, Config.TRANSCRIPTION_CONCURRENCY))
+        if self.backend == 'local':
+            self.local = LocalWhisperTranscriber(
+                Config.WHISPER_MODEL_SIZE,
+                compute_type=Config.WHISPER_COMPUTE_TYPE,
+                device=Config.WHISPER_DEVICE,
+                workers=Config.WHISPER_WORKERS,
+                cpu_threads=Config.WHISPER_CPU_THREADS
+            )
+
+    @property
+    def active_backend(self) -> str:
+        """Backend that actually serves requests (local may have fallen back to cloud)"""
+        return 'local' if self.local is not None else 'cloud'
+
+    def _cache_key(self, file_unique_id: str, language: Optional[str]) -> str:
+        return f"{file_unique_id}:{language or 'auto'}:{self.active_backend}"
+
+    def get_cached(self, file_unique_id: str, language: Optional[str] = None) -> Optional[str]:
+        """Previously transcribed text for a Telegram file, if any"""
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(file_unique_id, language))
+
+    def remember(self, file_unique_id: str, language: Optional[str], text: str):
+        """Cache a transcription; empty results are not cached so they can be retried"""
+        if self.cache is not None and text:
+            self.cache.set(self._cache_key(file_unique_id, language), text)
+
+    async def preload(self):
+        """Load the local model at startup so the first voice message doesn't pay for it"""
+        if self.local is None:
+            return
+        try:
+            await self.local.load()
+        except Exception as e:
+            logging.error(f"Failed to load local whisper model, using cloud transcription: {e}")
+            self.local = None
+
+    async def warm_up(self):
+        """Load the local model, or open the connection to the cloud API when it serves requests"""
+        await self.preload()
+        if self.local is None:
+            await get_cloud_client().models.retrieve("whisper-1")
+
+    def check_duration(self, duration: float):
+        """Raise AudioTooLongError when the duration policy rejects audio of this length"""
+        max_duration = Config.TRANSCRIPTION_MAX_DURATION
+        if max_duration and duration > max_duration and Config.TRANSCRIPTION_MAX_DURATION_POLICY == 'reject':
+            raise AudioTooLongError(f"Audio is {duration:.0f}s long, the limit is {max_duration}s")
+
+    def apply_duration_policy(self, audio: PreprocessedAudio) -> PreprocessedAudio:
+        """Reject or cut audio longer than TRANSCRIPTION_MAX_DURATION"""
+        self.check_duration(audio.original_duration)
+        max_duration = Config.TRANSCRIPTION_MAX_DURATION
+        if max_duration and audio.duration > max_duration:
+            logging.warning(f"Audio is {audio.duration:.0f}s long, transcribing the first {max_duration}s")
+            return audio.slice(0.0, max_duration)
+        return audio
+
+    async def transcribe(self, audio_file: BinaryIO, language: Optional[str] = None, filename: str = "voice.ogg") -> str:
+        """Transcribe an audio file object; `filename` tells the cloud API which format it is"""
+        self.stats['requests'] += 1
+        if Config.VAD_ENABLED or Config.TRANSCRIPTION_CHUNK_SECONDS > 0:
+            try:
+                processed = await asyncio.to_thread(preprocess_audio, audio_file, Config.VAD_ENABLED)
+            except Exception as e:
+                logging.warning(f"Audio preprocessing failed, transcribing original audio: {e}")
+                audio_file.seek(0)
+            else:
+                self.stats['audio_seconds'] += processed.original_duration
+                self.stats['audio_seconds_saved'] += processed.seconds_saved
+                return await self.transcribe_processed(self.apply_duration_policy(processed), language)
+
+        if self.local is not None:
+            try:
+                return await self.local.transcribe(audio_file, language)
+            except Exception as e:
+                logging.warning(f"Local transcription failed, falling back to cloud: {e}")
+                audio_file.seek(0)
+        return await transcribe_cloud(audio_file, language, filename)
+
+    async def transcribe_processed(self, audio: PreprocessedAudio, language: Optional[str] = None) -> str:
+        """Transcribe decoded audio, joining the text of all chunks"""
+        segments = await self.transcribe_segments(audio, language)
+        if len(segments) > 1:
+            timeline = ", ".join(f"{segment['start']:.1f}-{segment['end']:.1f}s: {len(segment['text'])} chars"
+                                 for segment in segments)
+            logging.info(f"Chunk transcripts ({timeline})")
+        return " ".join(segment['text'] for segment in segments if segment['text'])
+
+    async def transcribe_segments(self, audio: PreprocessedAudio, language: Optional[str] = None) -> List[Dict]:
+        """
+        Split audio at pauses into chunks of at most TRANSCRIPTION_CHUNK_SECONDS and
+        transcribe them concurrently (bounded by TRANSCRIPTION_CONCURRENCY).
+
+        Returns [{'start', 'end', 'text'}] in order; timestamps are seconds on the
+        timeline of the (silence-trimmed) audio.
+        """
+        chunks = split_at_pauses(audio, Config.TRANSCRIPTION_CHUNK_SECONDS)
+        if len(chunks) > 1:
+            logging.info(f"Transcribing {audio.duration:.1f}s of audio in {len(chunks)} chunks")
+        self.stats['chunks'] += len(chunks)
+
+        async def transcribe_chunk(start: float, end: float) -> Dict:
+            chunk = audio.slice(start, end)
+            if not chunk.speech_segments:
+                # Silence costs a request and Whisper tends to invent text for it
+                return {'start': round(start, 2), 'end': round(end, 2), 'text': ''}
+            async with queued('transcription', self._chunk_semaphore):
+                text = await self._transcribe_chunk(chunk, language)
+            return {'start': round(start, 2), 'end': round(end, 2), 'text': text.strip()}
+
+        return list(await asyncio.gather(*(transcribe_chunk(start, end) for start, end in chunks)))
+
+    async def _transcribe_chunk(self, audio: PreprocessedAudio, language: Optional[str]) -> str:
+        if self.local is not None:
+            try:
+                return await self.local.transcribe(audio.samples, language)
+            except Exception as e:
+                logging.warning(f"Local transcription failed, falling back to cloud: {e}")
+        audio_file = await asyncio.to_thread(audio.to_ogg)
+        return await transcribe_cloud(audio_file, language, "voice.ogg")
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+from bot.utils.files import atomic_write
+from bot.utils.ttl_store import TTLStore
+
+
+class TTSCache:
+    """
+    Content-addressed cache for synthesized speech.
+
+    Audio is stored on disk as `<sha256>.<format>`, keyed by the text and every
+    parameter that affects the output (voice, model, voice settings, format).
+    Total size is bounded by `max_bytes` with least-recently-used eviction.
+    The Telegram file_id of each sent voice message is remembered as well, so
+    repeated answers are re-sent by file_id without synthesis or upload.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, file_ids: TTLStore, audio_format: str = 'ogg'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.file_ids = file_ids
+        self.extension = f'.{audio_format}'
+        self.stats = {'hits': 0, 'misses': 0, 'file_id_hits': 0, 'evictions': 0}
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def make_key(text: str, request: Dict) -> str:
+        """Hash of the text and the resolved synthesis parameters"""
+        payload = json.dumps({'text': text, **request}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.extension)
+
+    def _scan(self):
+        # Rebuild the LRU order from file modification times
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.extension):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name[:-len(self.extension)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._files[key] = size
+            self._total_bytes += size
+
+    def get_audio(self, key: str) -> Optional[bytes]:
+        """Cached audio bytes, or None"""
+        if key not in self._files:
+            self.stats['misses'] += 1
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                audio = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            self._total_bytes -= self._files.pop(key)
+            self.stats['misses'] += 1
+            return None
+        self._files.move_to_end(key)
+        self.stats['hits'] += 1
+        return audio
+
+    def put_audio(self, key: str, audio: bytes):
+        """Store audio atomically and evict least recently used files over the size limit"""
+        if len(audio) > self.max_bytes:
+            return
+        try:
+            atomic_write(self._path(key), audio)
+        except OSError as e:
+            logging.warning(f"Failed to cache TTS audio {key}: {e}")
+            return
+
+        self._total_bytes += len(audio) - self._files.get(key, 0)
+        self._files[key] = len(audio)
+        self._files.move_to_end(key)
+        while self._total_bytes > self.max_bytes and self._files:
+            old_key, size = self._files.popitem(last=False)
+            self._total_bytes -= size
+            self.stats['evictions'] += 1
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        """Telegram file_id of a previously sent voice message with this audio"""
+        file_id = self.file_ids.get(key)
+        if file_id is not None:
+            self.stats['file_id_hits'] += 1
+        return file_id
+
+    def remember_file_id(self, key: str, file_id: str):
+        self.file_ids.set(key, file_id)
+
+    def forget_file_id(self, key: str):
+        self.file_ids.pop(key)
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'files': len(self._files), 'bytes': self._total_bytes}
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class Warmup:
+    """
+    Startup warm-up run before the bot serves updates.
+
+    Components (TLS connections, the RAG pipeline, the whisper model) are
+    registered as coroutine factories and run concurrently. A failing or slow
+    component is logged and skipped - warm-up only moves latency out of the
+    first user requests, it never stops the bot from starting.
+    """
+
+    def __init__(self, timeout: float = 60):
+        self.timeout = timeout
+        self.ready = False
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.total: Optional[float] = None
+        self._components: Dict[str, Callable[[], Awaitable[Any]]] = {}
+
+    def register(self, name: str, component: Callable[[], Awaitable[Any]]):
+        self._components[name] = component
+
+    async def _run_component(self, name: str, component: Callable[[], Awaitable[Any]]):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(component(), self.timeout)
+        except asyncio.TimeoutError:
+            self.errors[name] = f"timed out after {self.timeout:g}s"
+        except Exception as e:
+            self.errors[name] = str(e) or type(e).__name__
+        self.timings[name] = time.perf_counter() - started
+        if name in self.errors:
+            logging.warning(f"Warm-up of {name} failed in {self.timings[name] * 1000:.0f} ms: {self.errors[name]}")
+        else:
+            logging.info(f"Warm-up of {name} done in {self.timings[name] * 1000:.0f} ms")
+
+    async def run(self):
+        """Warm up all components, then mark the bot as ready"""
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_component(name, component)
+                               for name, component in self._components.items()))
+        self.total = time.perf_counter() - started
+        self.ready = True
+        logging.info(f"Warm-up finished in {self.total * 1000:.0f} ms, {len(self.errors)} component(s) failed")
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness and per-component timings in milliseconds"""
+        return {
+            'ready': self.ready,
+            'total_ms': round(self.total * 1000) if self.total is not None else None,
+            'components': {
+                name: {
+                    'ms': round(self.timings[name] * 1000) if name in self.timings else None,
+                    'ok': name in self.timings and name not in self.errors,
+                    **({'error': self.errors[name]} if name in self.errors else {})
+                }
+                for name in self._components
+            }
+        }
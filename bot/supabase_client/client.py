@@ -1,12 +1,14 @@
 import asyncio
 from typing import List, Optional, Dict, Any
 from supabase import create_client, Client
+from bot.utils.metrics import timed
 from .models import User, NotificationSettings
 
 class SupabaseClient:
     def __init__(self, supabase_url: str, supabase_key: str):
         self.client: Client = create_client(supabase_url, supabase_key)
     
+    @timed('supabase.get_user_by_telegram_id')
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[User]:
         try:
             response = self.client.table('users').select('*').eq('telegram_id', telegram_id).execute()
@@ -17,6 +19,7 @@ class SupabaseClient:
             pass  # User error suppressed for performance
             return None
     
+    @timed('supabase.create_or_update_user')
     async def create_or_update_user(self, user_data: Dict[str, Any]) -> Optional[User]:
         try:
             existing_user = await self.get_user_by_telegram_id(user_data['telegram_id'])
@@ -33,6 +36,7 @@ class SupabaseClient:
             pass  # User creation error suppressed for performance
             return None
     
+    @timed('supabase.search_content')
     async def search_content(self, user_id: int, query_embedding: List[float], limit: int = 5, threshold: float = 0.5) -> List[Dict[str, Any]]:
         """
         Vector similarity search engine for documents
@@ -218,6 +222,7 @@ class SupabaseClient:
             return []
     
     
+    @timed('supabase.create_user')
     async def create_user(self, telegram_id: int, username: str = None, first_name: str = None, last_name: str = None) -> Optional[User]:
         """Create user only if doesn't exist - for handlers compatibility"""
         # Check if user already exists
@@ -234,6 +239,15 @@ class SupabaseClient:
         # Remove None values to avoid column errors
         user_data = {k: v for k, v in user_data.items() if v is not None}
         
+        return await self.insert_user(**user_data)
+
+    @timed('supabase.insert_user')
+    async def insert_user(self, telegram_id: int, username: str = None) -> Optional[User]:
+        """Insert a new user without checking for an existing record first"""
+        user_data = {'telegram_id': telegram_id}
+        if username is not None:
+            user_data['username'] = username
+
         try:
             response = self.client.table('users').insert(user_data).execute()
             if response.data:
@@ -243,6 +257,7 @@ class SupabaseClient:
             # User creation failed due to RLS or other DB constraints
             return None
     
+    @timed('supabase.get_notification_settings')
     async def get_notification_settings(self, user_id: int) -> Optional[NotificationSettings]:
         """Get notification settings for a user"""
         try:
@@ -254,6 +269,7 @@ class SupabaseClient:
             pass  # Notification settings error suppressed for performance
             return None
     
+    @timed('supabase.create_or_update_notification_settings')
     async def create_or_update_notification_settings(self, user_id: int, settings: Dict[str, Any]) -> Optional[NotificationSettings]:
         """Create or update notification settings for a user"""
         try:
@@ -276,6 +292,7 @@ class SupabaseClient:
             pass  # Notification settings update error suppressed for performance
             return None
     
+    @timed('supabase.get_users_for_notification')
     async def get_users_for_notification(self, current_time: str, current_weekday: str) -> List[Dict[str, Any]]:
         """Get users who should receive notifications at current time and day"""
         try:
@@ -320,6 +337,7 @@ class SupabaseClient:
             pass  # Get notification users error suppressed for performance
             return []
     
+    @timed('supabase.get_all_notification_users')
     async def get_all_notification_users(self) -> List[User]:
         """Get all users who have notifications enabled"""
         try:
@@ -333,6 +351,22 @@ class SupabaseClient:
             pass  # Get all notification users error suppressed for performance
             return []
 
+    @timed('supabase.get_book_recipient_ids')
+    async def get_book_recipient_ids(self) -> List[int]:
+        """Get Telegram IDs of users who received the vitamin book"""
+        try:
+            response = self.client.table('users').select('telegram_id').eq('book_received', True).execute()
+            return [row['telegram_id'] for row in response.data or []]
+        except Exception as e:
+            pass  # Get book recipients error suppressed
+            return []
+
+    @timed('supabase.ping')
+    async def ping(self):
+        """Minimal query that opens the HTTP connection; errors are raised to the caller"""
+        self.client.table('users').select('telegram_id').limit(1).execute()
+
+    @timed('supabase.mark_book_received')
     async def mark_book_received(self, telegram_id: int) -> bool:
         """Mark that user has received the vitamin book"""
         try:
@@ -346,6 +380,7 @@ class SupabaseClient:
             pass  # Book received update error suppressed
             return False
 
+    @timed('supabase.get_weekly_statistics')
     async def get_weekly_statistics(self) -> Dict[str, Any]:
         """Get user activity statistics for the previous week"""
         try:
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from bot.services.fsm_storage import SQLiteStorage
+
+
+async def simulate_update(storage: BaseStorage, key: StorageKey, step: int) -> Dict[str, float]:
+    """Replay the storage calls of one FSM update (timezone flow) and time each of them"""
+    timings = {}
+
+    start = time.perf_counter()
+    await storage.get_state(key)
+    timings['get_state'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await storage.get_data(key)
+    timings['get_data'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await storage.update_data(key, {'frequency_key': 'daily', 'frequency_name': 'каждый день', 'step': step})
+    timings['update_data'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await storage.set_state(key, 'NotificationStates:waiting_for_timezone_manual')
+    timings['set_state'] = time.perf_counter() - start
+
+    timings['per_update'] = sum(timings.values())
+    return timings
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_benchmark(storage: BaseStorage, iterations: int, users: int) -> Dict[str, List[float]]:
+    results: Dict[str, List[float]] = {}
+    for i in range(iterations):
+        key = StorageKey(bot_id=1, chat_id=i % users, user_id=i % users)
+        for operation, seconds in (await simulate_update(storage, key, i)).items():
+            results.setdefault(operation, []).append(seconds)
+    await storage.close()
+    return results
+
+
+def create_storage(backend: str, redis_url: str, sqlite_path: str) -> BaseStorage:
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path, ttl=3600)
+    from aiogram.fsm.storage.redis import RedisStorage
+    return RedisStorage.from_url(redis_url, state_ttl=3600, data_ttl=3600)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmark FSM storage get/set latency per update')
+    parser.add_argument('--backend', choices=['memory', 'sqlite', 'redis'], action='append',
+                        help='Backend to benchmark (repeatable, default: memory and sqlite)')
+    parser.add_argument('--iterations', '-n', type=int, default=5000, help='Number of simulated updates')
+    parser.add_argument('--users', type=int, default=500, help='Number of distinct users')
+    parser.add_argument('--redis-url', default=os.getenv('FSM_REDIS_URL', 'redis://localhost:6379/0'))
+    args = parser.parse_args()
+
+    backends = args.backend or ['memory', 'sqlite']
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for backend in backends:
+            storage = create_storage(backend, args.redis_url, os.path.join(temp_dir, 'fsm.sqlite3'))
+            results = asyncio.run(run_benchmark(storage, args.iterations, args.users))
+
+            print(f"\n{backend} ({args.iterations} updates, {args.users} users), microseconds:")
+            print(f"{'operation':<12} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+            for operation, values in results.items():
+                micros = [v * 1_000_000 for v in values]
+                print(f"{operation:<12} {statistics.mean(micros):>9.1f} {percentile(micros, 50):>9.1f} "
+                      f"{percentile(micros, 95):>9.1f} {percentile(micros, 99):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,35 @@
+import asyncio
 import logging
+from typing import Any, Dict, Iterable, Optional
 from aiogram import Bot
 from bot.config import Config
+from bot.utils.ttl_store import TTLStore
 
+# Subscription status by user id. "Subscribed" is cached longer than "not subscribed",
+# so a user who has just joined the channel is recognized on the next tap.
+subscription_cache = TTLStore(
+    'subscription',
+    max_entries=Config.SUBSCRIPTION_CACHE_SIZE,
+    ttl=Config.SUBSCRIPTION_CACHE_TTL
+)
+subscription_stats = {'api_calls': 0, 'coalesced': 0, 'errors': 0}
 
-async def check_user_subscription(bot: Bot, user_id: int) -> bool:
+# Checks currently waiting for Telegram, shared by concurrent taps of the same user
+_in_flight: Dict[int, asyncio.Task] = {}
+
+
+async def fetch_user_subscription(bot: Bot, user_id: int) -> Optional[bool]:
     """
-    Check if user is subscribed to the channel
+    Ask Telegram whether the user is subscribed to the channel
 
     Args:
         bot: Aiogram Bot instance
         user_id: Telegram user ID
 
     Returns:
-        True if user is subscribed, False otherwise
+        True if subscribed, False if not, None if the check failed
     """
+    subscription_stats['api_calls'] += 1
     try:
         # Get channel username with @ prefix
         channel_username = f"@{Config.CHANNEL_USERNAME}"
@@ -33,10 +49,73 @@ async def check_user_subscription(bot: Bot, user_id: int) -> bool:
 
         logging.info(f"User {user_id} subscription check: {member.status} - {'✅ Subscribed' if is_subscribed else '❌ Not subscribed'}")
 
+        ttl = Config.SUBSCRIPTION_CACHE_TTL if is_subscribed else Config.SUBSCRIPTION_NEGATIVE_TTL
+        subscription_cache.set(str(user_id), is_subscribed, ttl=ttl)
         return is_subscribed
 
     except Exception as e:
+        subscription_stats['errors'] += 1
         logging.error(f"Error checking subscription for user {user_id}: {e}")
-        # If there's an error (e.g., user not found, channel not accessible),
-        # we assume user is not subscribed
-        return False
+        # Errors are not cached so the next tap asks Telegram again
+        return None
+
+
+async def check_user_subscription(bot: Bot, user_id: int, use_cache: bool = True) -> bool:
+    """
+    Check if user is subscribed to the channel
+
+    Uses the cached status when available; concurrent checks of the same user
+    share one get_chat_member call.
+
+    Args:
+        bot: Aiogram Bot instance
+        user_id: Telegram user ID
+        use_cache: Set to False to always ask Telegram
+
+    Returns:
+        True if user is subscribed, False otherwise
+    """
+    if use_cache:
+        cached = subscription_cache.get(str(user_id))
+        if cached is not None:
+            return cached
+
+    task = _in_flight.get(user_id)
+    if task is not None:
+        subscription_stats['coalesced'] += 1
+    else:
+        task = asyncio.create_task(fetch_user_subscription(bot, user_id))
+        _in_flight[user_id] = task
+        task.add_done_callback(lambda done: _in_flight.pop(user_id, None) if _in_flight.get(user_id) is done else None)
+
+    # If there's an error (e.g., user not found, channel not accessible),
+    # we assume user is not subscribed
+    return bool(await asyncio.shield(task))
+
+
+async def reverify_subscriptions(bot: Bot, user_ids: Iterable[int], concurrency: int = None) -> Dict[str, int]:
+    """Re-check many users against Telegram (bypassing the cache) and refresh their cached status"""
+    semaphore = asyncio.Semaphore(concurrency or Config.SUBSCRIPTION_VERIFY_CONCURRENCY)
+    result = {'checked': 0, 'subscribed': 0, 'not_subscribed': 0, 'errors': 0}
+
+    async def verify(user_id: int):
+        async with semaphore:
+            status = await fetch_user_subscription(bot, user_id)
+            # Spread the calls out so the batch doesn't eat the Bot API rate budget
+            await asyncio.sleep(Config.SUBSCRIPTION_VERIFY_DELAY)
+        result['checked'] += 1
+        if status is None:
+            result['errors'] += 1
+        elif status:
+            result['subscribed'] += 1
+        else:
+            result['not_subscribed'] += 1
+
+    await asyncio.gather(*(verify(user_id) for user_id in user_ids))
+    logging.info(f"Subscription re-verification finished: {result}")
+    return result
+
+
+def get_subscription_stats() -> Dict[str, Any]:
+    """Cache hit/miss counters plus Telegram API calls, coalesced checks and errors"""
+    return {**subscription_cache.get_stats(), **subscription_stats, 'in_flight': len(_in_flight)}
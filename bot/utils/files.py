@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: str) -> str:
+    """SHA-256 of the file content, read in 1 MiB blocks"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class FileHashCache:
+    """SHA-256 of files, recomputed only when a file's size or mtime change"""
+
+    def __init__(self):
+        self._hashes: Dict[str, Tuple[float, int, str]] = {}
+
+    def _cached(self, path: str, stat: os.stat_result):
+        cached = self._hashes.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        return None
+
+    def digest(self, path: str) -> str:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        digest = self._cached(path, stat)
+        if digest is None:
+            digest = sha256_file(path)
+            self._hashes[path] = (stat.st_mtime, stat.st_size, digest)
+        return digest
+
+    async def digest_async(self, path: str) -> str:
+        """Like digest, but a file that has to be read is hashed in a thread"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        digest = self._cached(path, stat)
+        if digest is None:
+            digest = await asyncio.to_thread(sha256_file, path)
+            self._hashes[path] = (stat.st_mtime, stat.st_size, digest)
+        return digest
+
+
+def atomic_write(path: str, data: bytes):
+    """Write to a temp file next to path and rename it over the target, so readers never see a partial file"""
+    directory = Path(path).parent
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{Path(path).name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def atomic_write_json(data: Any, path: str, **dump_options):
+    """atomic_write of data serialized as UTF-8 JSON"""
+    atomic_write(path, json.dumps(data, ensure_ascii=False, **dump_options).encode('utf-8'))
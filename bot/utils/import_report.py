@@ -0,0 +1,84 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import List, NamedTuple
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+# Heavy packages that must stay out of the startup path (they are imported on first use)
+DEFAULT_FORBIDDEN = ['langchain', 'langchain_core', 'langchain_openai', 'openai', 'anthropic',
+                     'faster_whisper', 'ctranslate2', 'av', 'PyPDF2']
+
+# bot.main measured at 4.0-4.6 s here (one CPU, mostly aiogram) and close to 9 s under load;
+# the wall-clock budget only catches gross regressions, the forbidden list is the precise check
+DEFAULT_BUDGET_MS = 10000
+
+
+class ImportRecord(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def measure_imports(module: str) -> List[ImportRecord]:
+    """Import `module` in a fresh interpreter with -X importtime and parse the report"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    records = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append(ImportRecord(name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return records
+
+
+def find_forbidden(records: List[ImportRecord], forbidden: List[str]) -> List[str]:
+    """Top-level packages from `forbidden` that were imported"""
+    return sorted({record.module.split('.')[0] for record in records if record.module.split('.')[0] in forbidden})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report import time of the bot and fail past a budget')
+    parser.add_argument('--module', default='bot.main', help='Module to import')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_TIME_BUDGET_MS', str(DEFAULT_BUDGET_MS))),
+                        help='Fail when the best cumulative import time exceeds this')
+    parser.add_argument('--runs', type=int, default=3, help='Imports to measure, the fastest one counts')
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules to list')
+    parser.add_argument('--forbid', action='append', help='Package that must not be imported (repeatable)')
+    args = parser.parse_args()
+
+    runs = [measure_imports(args.module) for _ in range(args.runs)]
+    records = min(runs, key=lambda run: run[-1].cumulative_us)
+    total_ms = records[-1].cumulative_us / 1000
+
+    # Direct dependencies of the measured module and of the bot's own packages
+    print(f"Import time of {args.module}: {total_ms:.0f} ms (best of {args.runs}, budget {args.budget_ms:.0f} ms)\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    interesting = [r for r in records if r.depth <= 2 or r.module.startswith('bot.')]
+    for record in sorted(interesting, key=lambda r: r.cumulative_us, reverse=True)[1:args.top + 1]:
+        print(f"{record.cumulative_us / 1000:>14.1f} {record.self_us / 1000:>9.1f}  {record.module}")
+
+    failures = []
+    leaked = find_forbidden(records, args.forbid or DEFAULT_FORBIDDEN)
+    if leaked:
+        failures.append(f"heavy packages imported at startup: {', '.join(leaked)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
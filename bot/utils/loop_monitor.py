@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+from bot.utils.metrics import metrics
+
+BOT_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def blocking_location(stack: traceback.StackSummary) -> str:
+    """Innermost frame in the bot's own code (where the blocking call was made), else the innermost frame"""
+    # Only frames of the running callback count, not the code that started the loop (bot/main.py)
+    callback_start = max((index for index, frame in enumerate(stack)
+                          if frame.filename.endswith(os.path.join('asyncio', 'events.py'))), default=-1)
+    for frame in reversed(stack[callback_start + 1:]):
+        if frame.filename.startswith(BOT_PACKAGE_DIR):
+            return f"{os.path.relpath(frame.filename, os.path.dirname(BOT_PACKAGE_DIR))}:{frame.lineno} {frame.name}"
+    frame = stack[-1]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+
+
+class LoopMonitor:
+    """
+    Event-loop lag sampler and blocking-call detector.
+
+    A coroutine wakes up every `interval` seconds and records how late it was
+    scheduled as the `event_loop.lag` stage; lags past `threshold` are also
+    recorded as `event_loop.blocked`. A watchdog thread checks that the sampler
+    keeps ticking: when the loop has been stuck for `threshold`, it captures
+    the loop thread's stack with sys._current_frames(), logs it and counts it
+    by the bot code location that made the blocking call.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, max_samples: int = 20):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: Counter = Counter()
+        self.samples: Deque[Dict] = deque(maxlen=max_samples)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logging.info(f"Event loop monitor started (blocking threshold {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _sample(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._last_tick = time.monotonic()
+            lag = max(0.0, self._last_tick - expected)
+            metrics.observe('event_loop.lag', lag)
+            if lag >= self.threshold:
+                metrics.observe('event_loop.blocked', lag)
+                logging.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+
+    def _watch(self):
+        """Watchdog thread: capture the loop's stack while it is blocked, once per block"""
+        reported_tick = None
+        while not self._stop.wait(self.threshold / 2):
+            last_tick = self._last_tick
+            overdue = time.monotonic() - last_tick - self.interval
+            if overdue < self.threshold or last_tick == reported_tick:
+                continue
+            reported_tick = last_tick
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            location = blocking_location(stack)
+            stack_text = "".join(traceback.format_list(stack[-12:]))
+            logging.warning(f"Event loop blocked for {overdue * 1000:.0f} ms at {location}:\n{stack_text}")
+            # Counters belong to the loop thread; the update runs as soon as the loop is free again
+            try:
+                self._loop.call_soon_threadsafe(self._record_stall, location, overdue, stack_text)
+            except RuntimeError:
+                return  # Loop closed during shutdown
+
+    def _record_stall(self, location: str, overdue: float, stack_text: str):
+        self.stalls[location] += 1
+        self.samples.append({'time': time.time(), 'location': location, 'ms': round(overdue * 1000), 'stack': stack_text})
+        metrics.increment('event_loop_stalls', location=location)
+
+    def top_locations(self, limit: int = 5) -> List:
+        """Code locations that blocked the loop most often"""
+        return self.stalls.most_common(limit)
@@ -0,0 +1,299 @@
+import asyncio
+import functools
+import inspect
+import logging
+import math
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from aiohttp import web
+
+# Sub-bucket resolution of the histograms: values are kept with under 1% relative error
+SIGNIFICANT_BITS = 8
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+# Sliding windows are built from slots of SLOT_SECONDS, kept for the longest window
+SLOT_SECONDS = 10
+MAX_WINDOW_SECONDS = 3600
+
+
+class Histogram:
+    """
+    HDR-style log-linear histogram of durations.
+
+    Durations are stored in microseconds, rounded down to SIGNIFICANT_BITS
+    significant bits, so every power-of-two range gets the same number of
+    buckets: memory stays small and percentiles keep a bounded relative
+    error whether a stage takes 50 µs or 50 s.
+    """
+
+    def __init__(self):
+        self.counts: Dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _bucket(micros: int) -> int:
+        shift = max(0, micros.bit_length() - SIGNIFICANT_BITS)
+        return (micros >> shift) << shift
+
+    @staticmethod
+    def _midpoint(bucket: int) -> float:
+        width = 1 << max(0, bucket.bit_length() - SIGNIFICANT_BITS)
+        return bucket + (width - 1) / 2
+
+    def record(self, seconds: float):
+        self.counts[self._bucket(int(seconds * 1_000_000))] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: 'Histogram'):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentiles(self, quantiles=QUANTILES) -> List[float]:
+        """Values in seconds at the given quantiles (0 when nothing was recorded)"""
+        if not self.count:
+            return [0.0 for _ in quantiles]
+        targets = sorted((max(1, round(q * self.count)), index) for index, q in enumerate(quantiles))
+        results = [0.0] * len(quantiles)
+        seen = 0
+        position = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            while position < len(targets) and seen >= targets[position][0]:
+                results[targets[position][1]] = min(self._midpoint(bucket) / 1_000_000, self.max)
+                position += 1
+        return results
+
+
+class RollingHistogram:
+    """
+    Recent durations and errors of one stage in time slots.
+
+    Each SLOT_SECONDS slot has its own histogram; a sliding window (1m, 15m, 1h)
+    merges the slots it covers. Slots older than MAX_WINDOW_SECONDS are dropped.
+    """
+
+    def __init__(self):
+        self._slots: Dict[int, Histogram] = {}
+        self._errors: Dict[int, int] = defaultdict(int)
+
+    @staticmethod
+    def _slot(now: Optional[float] = None) -> int:
+        return int((now if now is not None else time.monotonic()) // SLOT_SECONDS)
+
+    def _prune(self, current: int):
+        oldest = current - MAX_WINDOW_SECONDS // SLOT_SECONDS
+        for slot in [slot for slot in self._slots if slot <= oldest]:
+            del self._slots[slot]
+            self._errors.pop(slot, None)
+
+    def _current_histogram(self) -> Tuple[int, Histogram]:
+        slot = self._slot()
+        if slot not in self._slots:
+            self._prune(slot)
+            self._slots[slot] = Histogram()
+        return slot, self._slots[slot]
+
+    def record(self, seconds: float, error: bool = False):
+        slot, histogram = self._current_histogram()
+        histogram.record(seconds)
+        if error:
+            self._errors[slot] += 1
+
+    def record_error(self):
+        slot, _ = self._current_histogram()
+        self._errors[slot] += 1
+
+    def window(self, seconds: float) -> Tuple[Histogram, int]:
+        """Merged histogram and error count of the last `seconds`"""
+        first = self._slot() - math.ceil(seconds / SLOT_SECONDS) + 1
+        merged = Histogram()
+        for slot, histogram in self._slots.items():
+            if slot >= first:
+                merged.merge(histogram)
+        errors = sum(count for slot, count in self._errors.items() if slot >= first)
+        return merged, errors
+
+
+class Metrics:
+    """In-process latency, error and in-flight counters per pipeline stage"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.durations: Dict[str, Histogram] = defaultdict(Histogram)
+        self.recent: Dict[str, RollingHistogram] = defaultdict(RollingHistogram)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = defaultdict(int)
+
+    def increment(self, name: str, **labels: str):
+        """Count an event, exported as bot_<name>_total{labels}"""
+        self.counters[(name, tuple(sorted(labels.items())))] += 1
+
+    def observe(self, stage: str, seconds: float, error: bool = False):
+        self.durations[stage].record(seconds)
+        self.recent[stage].record(seconds, error)
+        if error:
+            self.errors[stage] += 1
+
+    def record_error(self, stage: str):
+        """Count a failure the stage handled itself (so no exception reached the timer)"""
+        self.errors[stage] += 1
+        self.recent[stage].record_error()
+
+    def window_stats(self, seconds: float) -> Dict[str, Dict[str, Any]]:
+        """Count, rate per second, p50/p95/p99 and errors of every stage active in the last `seconds`"""
+        # A window longer than the uptime would understate the rate
+        covered = min(seconds, max(time.monotonic() - self.started, SLOT_SECONDS))
+        stats = {}
+        for stage, rolling in sorted(self.recent.items()):
+            histogram, errors = rolling.window(seconds)
+            if not histogram.count and not errors:
+                continue
+            p50, p95, p99 = histogram.percentiles((0.5, 0.95, 0.99))
+            stats[stage] = {
+                'count': histogram.count,
+                'rate': histogram.count / covered,
+                'p50': p50,
+                'p95': p95,
+                'p99': p99,
+                'errors': errors
+            }
+        return stats
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines = [
+            "# HELP bot_stage_duration_seconds Duration of bot pipeline stages",
+            "# TYPE bot_stage_duration_seconds summary",
+        ]
+        for stage, histogram in sorted(self.durations.items()):
+            for quantile, value in zip(QUANTILES, histogram.percentiles()):
+                lines.append(f'bot_stage_duration_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'bot_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'bot_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        lines += [
+            "# HELP bot_stage_errors_total Stage executions that raised an exception",
+            "# TYPE bot_stage_errors_total counter",
+        ]
+        for stage in sorted(self.durations):
+            lines.append(f'bot_stage_errors_total{{stage="{stage}"}} {self.errors.get(stage, 0)}')
+
+        lines += [
+            "# HELP bot_stage_in_flight Stage executions currently running",
+            "# TYPE bot_stage_in_flight gauge",
+        ]
+        for stage, running in sorted(self.in_flight.items()):
+            lines.append(f'bot_stage_in_flight{{stage="{stage}"}} {running}')
+
+        current_name = None
+        for (name, labels), value in sorted(self.counters.items()):
+            if name != current_name:
+                lines.append(f"# TYPE bot_{name}_total counter")
+                current_name = name
+            label_text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels)
+            lines.append(f"bot_{name}_total{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+class timed:
+    """
+    Time a pipeline stage, as a context manager or a decorator.
+
+        with timed('rag.llm'):
+            response = await llm.ainvoke(...)
+
+        @timed('supabase.search_content')
+        async def search_content(...): ...
+
+    Exceptions are counted as errors of the stage and re-raised.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._started: Optional[float] = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        metrics.in_flight[self.stage] += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics.in_flight[self.stage] -= 1
+        metrics.observe(self.stage, time.perf_counter() - self._started, error=exc_type is not None)
+        return False
+
+    def __call__(self, func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(self.stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+@asynccontextmanager
+async def queued(stage: str, semaphore: asyncio.Semaphore):
+    """
+    Hold `semaphore`, timing the wait as the `<stage>.queue` stage.
+
+    The in-flight count of that stage is the number of callers waiting, i.e. the queue depth.
+    """
+    with timed(f"{stage}.queue"):
+        await semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving /metrics for Prometheus"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            logging.info(f"Metrics available at http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            logging.warning(f"Metrics server not started on {self.host}:{self.port}: {e}")
+            await self.stop()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,162 @@
+import struct
+from typing import Iterator, List, NamedTuple
+
+OGG_CAPTURE = b'OggS'
+HEADER = struct.Struct('<4sBBqIII B')  # capture, version, flags, granule, serial, sequence, crc, segments
+
+FLAG_CONTINUED = 0x01
+FLAG_BOS = 0x02
+FLAG_EOS = 0x04
+
+
+def _crc_table() -> List[int]:
+    # Ogg uses CRC-32 with polynomial 0x04C11DB7, no reflection, zero initial value
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+CRC_TABLE = _crc_table()
+
+
+def ogg_crc(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ CRC_TABLE[((crc >> 24) & 0xFF) ^ byte]
+    return crc
+
+
+class OggPage(NamedTuple):
+    flags: int
+    granule: int
+    serial: int
+    sequence: int
+    lacing: bytes
+    body: bytes
+
+    @property
+    def packets_completed(self) -> int:
+        """Number of packets that end on this page (a lacing value below 255 ends a packet)"""
+        return sum(1 for value in self.lacing if value < 255)
+
+    def to_bytes(self) -> bytes:
+        header = HEADER.pack(OGG_CAPTURE, 0, self.flags, self.granule, self.serial, self.sequence, 0, len(self.lacing))
+        page = bytearray(header + self.lacing + self.body)
+        struct.pack_into('<I', page, 22, ogg_crc(page))
+        return bytes(page)
+
+
+def read_pages(data: bytes) -> Iterator[OggPage]:
+    """Parse an Ogg bitstream into pages"""
+    position = 0
+    while position < len(data):
+        capture, _, flags, granule, serial, sequence, _, segments = HEADER.unpack_from(data, position)
+        if capture != OGG_CAPTURE:
+            raise ValueError(f"Not an Ogg page at offset {position}")
+        lacing_start = position + HEADER.size
+        lacing = data[lacing_start:lacing_start + segments]
+        body_start = lacing_start + segments
+        body_end = body_start + sum(lacing)
+        if body_end > len(data):
+            raise ValueError("Truncated Ogg page")
+        yield OggPage(flags, granule, serial, sequence, lacing, data[body_start:body_end])
+        position = body_end
+
+
+# Frame duration in 48 kHz samples for each Opus TOC configuration (RFC 6716, section 3.1)
+FRAME_SAMPLES = [480, 960, 1920, 2880] * 3 + [480, 960] * 2 + [120, 240, 480, 960] * 4
+
+
+def opus_packet_samples(packet: bytes) -> int:
+    """Number of 48 kHz samples an Opus packet decodes to, from its TOC byte"""
+    if not packet:
+        return 0
+    frame_samples = FRAME_SAMPLES[packet[0] >> 3]
+    code = packet[0] & 0x03
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    else:
+        frames = packet[1] & 0x3F if len(packet) > 1 else 0
+    return frame_samples * frames
+
+
+def opus_pre_skip(head: bytes) -> int:
+    """Pre-skip (priming samples to discard) from an OpusHead packet"""
+    if not head.startswith(b'OpusHead') or len(head) < 12:
+        raise ValueError("Stream does not start with an OpusHead packet")
+    return struct.unpack_from('<H', head, 10)[0]
+
+
+def concat_opus(streams: List[bytes]) -> bytes:
+    """
+    Join Ogg/Opus files into one logical stream without re-encoding.
+
+    Headers (OpusHead, OpusTags) are taken from the first stream and dropped
+    from the others; later pages get the first stream's serial number and
+    continued sequence numbers. Granule positions are recomputed from the
+    packet durations: each later stream starts where the audio before it ends,
+    less its pre-skip, so its priming samples are not counted in the timeline.
+    End trimming of every stream but the last is dropped, since RFC 7845 only
+    allows it on the final (EOS) page. All streams must share the same encoder settings.
+    """
+    if len(streams) == 1:
+        return streams[0]
+
+    output = []
+    serial = None
+    sequence = 0
+    granule_offset = 0
+    last_granule = 0
+    for index, stream in enumerate(streams):
+        pages = list(read_pages(stream))
+        if not pages:
+            continue
+        is_last_stream = index == len(streams) - 1
+        if index > 0:
+            granule_offset -= opus_pre_skip(pages[0].body)
+
+        headers_left = 2  # OpusHead and OpusTags packets
+        samples = 0  # Untrimmed samples of the audio packets completed so far
+        packet = bytearray()
+        for page_index, page in enumerate(pages):
+            if headers_left > 0:
+                headers_left -= page.packets_completed
+                if index > 0:
+                    continue
+                granule = page.granule
+            else:
+                position = 0
+                for value in page.lacing:
+                    packet += page.body[position:position + value]
+                    position += value
+                    if value < 255:
+                        samples += opus_packet_samples(bytes(packet))
+                        packet = bytearray()
+                if page.granule == -1:
+                    granule = -1
+                elif is_last_stream and page_index == len(pages) - 1:
+                    # The encoder's end trimming is kept, this is the final page of the joined stream
+                    granule = max(granule_offset + page.granule, last_granule)
+                else:
+                    granule = max(granule_offset + samples, last_granule)
+                if granule != -1:
+                    last_granule = granule
+
+            if serial is None:
+                serial = page.serial
+            flags = page.flags & ~FLAG_EOS
+            if index > 0:
+                flags &= ~FLAG_BOS
+            output.append(page._replace(flags=flags, granule=granule, serial=serial, sequence=sequence))
+            sequence += 1
+        granule_offset += samples
+
+    if output:
+        output[-1] = output[-1]._replace(flags=output[-1].flags | FLAG_EOS)
+    return b''.join(page.to_bytes() for page in output)
@@ -0,0 +1,10 @@
+from bot.config import Config
+from bot.utils.ttl_store import TTLStore
+
+# Pagination/session state per user, bounded by size and age (keys are "{telegram_id}:{flow}")
+user_pagination_data = TTLStore(
+    'pagination',
+    max_entries=Config.PAGINATION_MAX_ENTRIES,
+    ttl=Config.PAGINATION_TTL,
+    sqlite_path=Config.PAGINATION_SQLITE_PATH
+)
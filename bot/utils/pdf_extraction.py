@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+import PyPDF2
+from bot.utils.files import FileHashCache, atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent.parent / 'data' / 'pdf_text_cache'
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """Extract text of pages [start, end); runs inside a worker process"""
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[index].extract_text() or "" for index in range(start, end)]
+
+
+def count_pages(file_path: str) -> int:
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+class PDFTextExtractor:
+    """
+    PDF text extraction with page-level parallelism and a cache keyed by file hash.
+
+    Pages are extracted in batches of `pages_per_task` on a process pool (PyPDF2
+    is pure Python, so threads would not help). Results are cached as JSON under
+    `cache_dir/<sha256>.json`, so a file is only parsed again when its content changes.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, workers: Optional[int] = None, pages_per_task: int = 8):
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.stats = {'cache_hits': 0, 'extractions': 0, 'pages': 0}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # iter_pages runs on the default thread pool when called through stream_pages
+        self._executor_lock = threading.Lock()
+        self._hashes = FileHashCache()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def close(self):
+        """Shut down the worker processes"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def file_hash(self, file_path: str) -> str:
+        """SHA-256 of the file, recomputed only when size or mtime change"""
+        return self._hashes.digest(file_path)
+
+    def _cache_path(self, digest: str) -> Path:
+        return self.cache_dir / f"{digest}.json"
+
+    def _load_cached(self, digest: str) -> Optional[List[str]]:
+        try:
+            with open(self._cache_path(digest), 'r', encoding='utf-8') as f:
+                pages = json.load(f)['pages']
+        except (OSError, ValueError, KeyError):
+            return None
+        self.stats['cache_hits'] += 1
+        return pages
+
+    def _store(self, digest: str, pages: List[str]):
+        try:
+            atomic_write_json({'pages': pages}, str(self._cache_path(digest)))
+        except OSError as e:
+            logger.warning(f"Failed to cache extracted text: {e}")
+
+    def _page_ranges(self, file_path: str) -> List[Tuple[int, int]]:
+        page_count = count_pages(file_path)
+        return [(start, min(start + self.pages_per_task, page_count))
+                for start in range(0, page_count, self.pages_per_task)]
+
+    def iter_pages(self, file_path: str) -> Iterator[str]:
+        """
+        Yield page texts in order as soon as they are extracted.
+
+        Batches run in parallel; the next page is yielded once its batch is done,
+        so chunking can start before the whole document is parsed.
+        """
+        digest = self.file_hash(file_path)
+        cached = self._load_cached(digest)
+        if cached is not None:
+            yield from cached
+            return
+
+        ranges = self._page_ranges(file_path)
+        if len(ranges) <= 1:
+            # A small document is not worth the round trip to a worker process
+            batches = iter([extract_page_range(file_path, *ranges[0])] if ranges else [])
+        else:
+            executor = self._get_executor()
+            batches = (future.result() for future in
+                       [executor.submit(extract_page_range, file_path, start, end) for start, end in ranges])
+
+        pages = []
+        for batch in batches:
+            for text in batch:
+                pages.append(text)
+                yield text
+
+        self.stats['extractions'] += 1
+        self.stats['pages'] += len(pages)
+        self._store(digest, pages)
+
+    def extract_pages(self, file_path: str) -> List[str]:
+        return list(self.iter_pages(file_path))
+
+    def extract_text(self, file_path: str) -> str:
+        """Whole document text, pages joined with newlines"""
+        return "\n".join(self.iter_pages(file_path))
+
+    async def stream_pages(self, file_path: str) -> AsyncIterator[str]:
+        """Async version of iter_pages; parsing never blocks the event loop"""
+        loop = asyncio.get_running_loop()
+        pages = self.iter_pages(file_path)
+        done = object()
+        while True:
+            text = await loop.run_in_executor(None, next, pages, done)
+            if text is done:
+                break
+            yield text
+
+    async def extract_text_async(self, file_path: str) -> str:
+        return "\n".join([text async for text in self.stream_pages(file_path)])
+
+
+_default_extractor: Optional[PDFTextExtractor] = None
+
+
+def get_pdf_extractor() -> PDFTextExtractor:
+    """Shared extractor, so the worker pool and hash cache are reused"""
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = PDFTextExtractor()
+    return _default_extractor
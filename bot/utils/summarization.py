@@ -1,21 +1,116 @@
+import argparse
+import asyncio
 import json
 import os
 import logging
-import anthropic
+import random
+import time
 from pathlib import Path
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 from dotenv import load_dotenv
-import PyPDF2
+from bot.utils.files import atomic_write_json, sha256_file
+
+if TYPE_CHECKING:
+    import anthropic
 
 logger = logging.getLogger(__name__)
 
-def get_claude_response(client: anthropic.Anthropic, text: str, system_prompt: str, user_prompt: str) -> str:
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+MAX_RETRIES = 5
+
+# (system prompt, user prompt) for every metadata field
+PROMPTS = {
+    "name": (
+        "Вы профессиональный контент-анализатор. Придумайте четкое, краткое название.",
+        "Основываясь на этом контенте, предложите подходящее название для видео (макс. 5 слов). В качестве результаты оставь только предлагаемое название"
+    ),
+    "short_description": (
+        "Вы профессиональный автор контента. Создайте краткое описание в формате характеристик и ключевых моментов.",
+        "Создайте краткое описание (1-2 предложения) основных идей и практической пользы этого контента. Пишите в стиле аннотации, перечисляя ключевые темы и выводы. Не используйте форму пересказа от третьего лица. В качестве результата оставь только описание"
+    ),
+    "long_description": (
+        "Вы профессиональный автор контента. Создайте информативное описание в формате структурированного резюме.",
+        "Создайте подробное описание (3-5 предложений), перечисляя основные темы, обсуждаемые вопросы и ключевые выводы. Пишите как аннотацию или резюме материала, описывая содержание через перечисление тем и идей. Не пересказывайте от третьего лица. В качестве результата оставь только описание"
+    )
+}
+
+# Status codes worth retrying: rate limits, server errors and overload
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504, 529}
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, dropped connections and retryable status codes"""
+    import anthropic
+
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in RETRYABLE_STATUSES
+
+
+# Structured mode: all three fields from one call, returned through a tool schema
+METADATA_TOOL = {
+    "name": "save_metadata",
+    "description": "Сохранить название и описания материала",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string", "description": "Название для видео, максимум 5 слов"},
+            "short_description": {"type": "string", "description": "Краткое описание, 1-2 предложения"},
+            "long_description": {"type": "string", "description": "Подробное описание, 3-5 предложений"}
+        },
+        "required": ["name", "short_description", "long_description"]
+    }
+}
+STRUCTURED_SYSTEM_PROMPT = "Вы профессиональный контент-анализатор и автор контента. Создайте название и описания материала."
+STRUCTURED_USER_PROMPT = (
+    "Основываясь на этом контенте, заполните поля:\n"
+    "- name: подходящее название для видео (макс. 5 слов);\n"
+    "- short_description: краткое описание (1-2 предложения) основных идей и практической пользы, "
+    "в стиле аннотации, перечисляя ключевые темы и выводы;\n"
+    "- long_description: подробное описание (3-5 предложений) основных тем, обсуждаемых вопросов и ключевых выводов, "
+    "как аннотация или резюме материала.\n"
+    "Не используйте форму пересказа от третьего лица."
+)
+CHUNK_SUMMARY_PROMPT = (
+    "Это фрагмент большого документа. Кратко перечислите его основные темы, идеи и выводы "
+    "(до 10 предложений), чтобы по ним потом можно было описать весь документ."
+)
+
+# Rough size of a token for Russian text, used to keep requests within the input budget
+CHARS_PER_TOKEN = 3
+
+# Tokens used by this run, to compare modes
+token_usage = {'requests': 0, 'input_tokens': 0, 'output_tokens': 0}
+
+
+async def create_message(client: "anthropic.AsyncAnthropic", semaphore: Optional[asyncio.Semaphore] = None, **kwargs):
+    """Send a messages.create request, retried with exponential backoff on transient errors"""
+    semaphore = semaphore or asyncio.Semaphore(1)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                message = await client.messages.create(model=CLAUDE_MODEL, temperature=0, **kwargs)
+            token_usage['requests'] += 1
+            usage = getattr(message, 'usage', None)
+            if usage is not None:
+                token_usage['input_tokens'] += usage.input_tokens
+                token_usage['output_tokens'] += usage.output_tokens
+            return message
+        except Exception as e:
+            if not is_retryable(e) or attempt == MAX_RETRIES:
+                raise
+            # Backoff with jitter so parallel requests don't retry in lockstep
+            delay = min(60, 2 ** attempt) * (0.5 + random.random())
+            logger.warning(f"Claude request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def get_claude_response(client: "anthropic.AsyncAnthropic", text: str, system_prompt: str, user_prompt: str,
+                              semaphore: Optional[asyncio.Semaphore] = None) -> str:
     """Helper function to get response from Claude API"""
     try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
+        message = await create_message(
+            client,
+            semaphore,
             max_tokens=1000,
-            temperature=0,
             system=system_prompt,
             messages=[
                 {"role": "user", "content": f"{user_prompt}\n\n{text}"}
@@ -28,112 +123,191 @@ def get_claude_response(client: anthropic.Anthropic, text: str, system_prompt: s
         logger.error(f"Error getting Claude response: {e}")
         return ""
 
+def validate_metadata(data: Dict) -> Dict[str, str]:
+    """Check that the response has all fields as non-empty strings"""
+    metadata = {}
+    for field in PROMPTS:
+        value = data.get(field) if isinstance(data, dict) else None
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"Field '{field}' is missing or empty")
+        metadata[field] = value.strip()
+    if len(metadata["name"].split()) > 8:
+        logger.warning(f"Generated name is longer than requested: {metadata['name']}")
+    return metadata
+
+async def get_structured_metadata(client: "anthropic.AsyncAnthropic", text: str,
+                                  semaphore: Optional[asyncio.Semaphore] = None, attempts: int = 2) -> Dict[str, str]:
+    """Request name and both descriptions in a single call"""
+    for attempt in range(attempts):
+        message = await create_message(
+            client,
+            semaphore,
+            max_tokens=1500,
+            system=STRUCTURED_SYSTEM_PROMPT,
+            tools=[METADATA_TOOL],
+            tool_choice={"type": "tool", "name": METADATA_TOOL["name"]},
+            messages=[
+                {"role": "user", "content": f"{STRUCTURED_USER_PROMPT}\n\n{text}"}
+            ]
+        )
+        tool_input = next((block.input for block in message.content if block.type == "tool_use"), None)
+        try:
+            return validate_metadata(tool_input)
+        except ValueError as e:
+            logger.warning(f"Invalid structured response (attempt {attempt + 1}/{attempts}): {e}")
+    raise ValueError("Claude did not return valid metadata")
+
+def split_into_chunks(text: str, max_chars: int) -> List[str]:
+    """Split text into chunks of at most max_chars, preferring paragraph boundaries"""
+    chunks = []
+    while len(text) > max_chars:
+        cut = text.rfind("\n\n", 0, max_chars)
+        if cut < max_chars // 2:
+            cut = text.rfind(" ", 0, max_chars)
+        cut = cut if cut > 0 else max_chars
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+async def fit_to_budget(client: "anthropic.AsyncAnthropic", text: str, max_input_tokens: int, strategy: str = "truncate",
+                        semaphore: Optional[asyncio.Semaphore] = None) -> str:
+    """
+    Shrink text to about max_input_tokens.
+
+    "truncate" keeps the beginning of the document; "map-reduce" summarizes
+    budget-sized chunks concurrently and works on the joined summaries.
+    """
+    max_chars = max_input_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    if strategy == "truncate":
+        logger.info(f"Truncating document from {len(text)} to {max_chars} characters")
+        return text[:max_chars]
+
+    chunks = split_into_chunks(text, max_chars)
+    logger.info(f"Summarizing {len(chunks)} chunks of a {len(text)} character document")
+    summaries = await asyncio.gather(*(
+        get_claude_response(client, chunk, "Вы профессиональный контент-анализатор.", CHUNK_SUMMARY_PROMPT, semaphore)
+        for chunk in chunks
+    ))
+    reduced = "\n\n".join(summary.strip() for summary in summaries if summary.strip())
+    if not reduced:
+        raise ValueError("All chunk summaries failed")
+    if len(reduced) >= len(text):
+        return reduced[:max_chars]
+    return await fit_to_budget(client, reduced, max_input_tokens, strategy, semaphore)
+
 def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text content from a PDF file"""
+    """Extract text content from a PDF file (parallel by page, cached by file hash)"""
+    from bot.utils.pdf_extraction import get_pdf_extractor
+
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            return text
+        return get_pdf_extractor().extract_text(file_path)
     except Exception as e:
         logger.error(f"Error extracting text from PDF {file_path}: {e}")
         raise
 
-def process_text_file(file_path: str, api_key: Optional[str] = None) -> Dict:
+def read_file_content(file_path: str) -> str:
+    """Read text from a .txt or .pdf file"""
+    if file_path.endswith('.pdf'):
+        return extract_text_from_pdf(file_path)
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+def create_client(api_key: Optional[str] = None) -> "anthropic.AsyncAnthropic":
+    """Async Claude client; retries are handled by get_claude_response"""
+    # Get API key with better error handling
+    api_key = api_key or os.getenv('CLAUDE_API_KEY')
+    if not api_key:
+        raise ValueError("CLAUDE_API_KEY not found in environment variables")
+    # Heavy import, only needed when there is something to send to Claude
+    import anthropic
+    return anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
+
+async def process_text_file_async(file_path: str, client: "anthropic.AsyncAnthropic",
+                                  request_semaphore: Optional[asyncio.Semaphore] = None,
+                                  mode: str = "structured", long_input: str = "truncate",
+                                  max_input_tokens: int = 30000) -> Dict:
     """
     Process a single text or PDF file to generate video metadata using Claude API.
 
+    In "structured" mode the name and both descriptions come from one call (the
+    document is sent once); "separate" mode sends one request per field, concurrently.
+
     Args:
         file_path: Path to the text or PDF file
-        api_key: Optional Claude API key (will use env var if not provided)
+        client: Async Claude client
+        request_semaphore: Limits concurrent Claude requests across all files
+        mode: "structured" or "separate"
+        long_input: "truncate" or "map-reduce" for documents over max_input_tokens
+        max_input_tokens: Approximate input budget per request
 
     Returns:
         Dictionary containing video metadata (name, descriptions)
     """
     try:
-        # Get API key with better error handling
-        api_key = api_key or os.getenv('CLAUDE_API_KEY')
-        if not api_key:
-            raise ValueError("CLAUDE_API_KEY not found in environment variables")
-
-        # Initialize Claude client with the API key
-        client = anthropic.Anthropic(api_key=api_key)
-
-        # Read file content based on file type
+        # PDF parsing is CPU bound, keep it off the event loop
         if file_path.endswith('.pdf'):
-            content = extract_text_from_pdf(file_path)
+            from bot.utils.pdf_extraction import get_pdf_extractor
+            content = await get_pdf_extractor().extract_text_async(file_path)
         else:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-        
-        # Get video name from content
-        name = get_claude_response(
-            client,
-            content,
-            "Вы профессиональный контент-анализатор. Придумайте четкое, краткое название.",
-            "Основываясь на этом контенте, предложите подходящее название для видео (макс. 5 слов). В качестве результаты оставь только предлагаемое название"
-        )
-        
-        # Get short description
-        short_desc = get_claude_response(
-            client,
-            content,
-            "Вы профессиональный автор контента. Создайте краткое описание в формате характеристик и ключевых моментов.",
-            "Создайте краткое описание (1-2 предложения) основных идей и практической пользы этого контента. Пишите в стиле аннотации, перечисляя ключевые темы и выводы. Не используйте форму пересказа от третьего лица. В качестве результата оставь только описание"
-        )
+            content = await asyncio.to_thread(read_file_content, file_path)
+        content = await fit_to_budget(client, content, max_input_tokens, long_input, request_semaphore)
+
+        if mode == "structured":
+            metadata = await get_structured_metadata(client, content, request_semaphore)
+        else:
+            responses = await asyncio.gather(*(
+                get_claude_response(client, content, system_prompt, user_prompt, request_semaphore)
+                for system_prompt, user_prompt in PROMPTS.values()
+            ))
+            # get_claude_response returns "" on errors: an empty field fails the file, so it
+            # is not saved or recorded in the manifest and --changed-only retries it
+            metadata = validate_metadata(dict(zip(PROMPTS, responses)))
 
-        # Get long description
-        long_desc = get_claude_response(
-            client,
-            content,
-            "Вы профессиональный автор контента. Создайте информативное описание в формате структурированного резюме.",
-            "Создайте подробное описание (3-5 предложений), перечисляя основные темы, обсуждаемые вопросы и ключевые выводы. Пишите как аннотацию или резюме материала, описывая содержание через перечисление тем и идей. Не пересказывайте от третьего лица. В качестве результата оставь только описание"
-        )
-        
         # Create metadata dictionary
-        metadata = {
-            "name": name.strip(),
-            "short_description": short_desc.strip(),
-            "long_description": long_desc.strip(),
-            "file_name": Path(file_path).stem
-        }
+        metadata["file_name"] = Path(file_path).stem
         
         logger.info(f"Successfully processed {file_path}")
         return metadata
         
-    except ValueError as ve:
-        logger.error(f"API Key Error: {ve}")
-        raise
     except Exception as e:
         logger.error(f"Error processing file {file_path}: {e}")
         raise
 
+def process_text_file(file_path: str, api_key: Optional[str] = None) -> Dict:
+    """Synchronous wrapper around process_text_file_async for a single file"""
+    async def run():
+        client = create_client(api_key)
+        try:
+            return await process_text_file_async(file_path, client)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+def load_json(path: str, default: Dict) -> Dict:
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return default
+
+def add_video_entry(json_content: Dict, metadata: Dict):
+    """Add or update video entry"""
+    json_content.setdefault("videos", {})[metadata["file_name"]] = {
+        "name": metadata["name"],
+        "short_description": metadata["short_description"],
+        "long_description": metadata["long_description"]
+    }
+
 def save_video_descriptions(metadata: Dict, output_path: str):
     """Save video metadata to JSON file"""
     try:
-        # Create output directory if it doesn't exist
-        output_dir = Path(output_path).parent
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
         # Create or update JSON structure
-        if os.path.exists(output_path):
-            with open(output_path, 'r', encoding='utf-8') as f:
-                json_content = json.load(f)
-        else:
-            json_content = {"videos": {}}
-        
-        # Add or update video entry
-        json_content["videos"][metadata["file_name"]] = {
-            "name": metadata["name"],
-            "short_description": metadata["short_description"],
-            "long_description": metadata["long_description"]
-        }
-        
-        # Save updated JSON
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(json_content, f, ensure_ascii=False, indent=4)
+        json_content = load_json(output_path, {"videos": {}})
+        add_video_entry(json_content, metadata)
+        atomic_write_json(json_content, output_path, indent=4)
             
         logger.info(f"Successfully saved metadata to {output_path}")
         return True
@@ -142,6 +316,37 @@ def save_video_descriptions(metadata: Dict, output_path: str):
         logger.error(f"Error saving metadata: {e}")
         return False
 
+class HashManifest:
+    """
+    Content hashes of the files descriptions were generated from, stored next to the output JSON.
+
+    Hashes are only recomputed when a file's size or mtime changed, so checking an
+    unchanged library costs one stat() per file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = load_json(path, {})
+
+    def fingerprint(self, file_path: str) -> Dict:
+        stat = os.stat(file_path)
+        entry = self.entries.get(Path(file_path).name)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+            sha256 = entry['sha256']
+        else:
+            sha256 = sha256_file(file_path)
+        return {'sha256': sha256, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def is_changed(self, file_path: str, fingerprint: Dict) -> bool:
+        entry = self.entries.get(Path(file_path).name)
+        return entry is None or entry.get('sha256') != fingerprint['sha256']
+
+    def update(self, file_path: str, fingerprint: Dict):
+        self.entries[Path(file_path).name] = fingerprint
+
+    def save(self):
+        atomic_write_json(self.entries, self.path, indent=4)
+
 def process_single_file(file_path: str, output_path: str = "configs/video_descriptions.json"):
     """
     Process a single text file and save its metadata.
@@ -168,7 +373,89 @@ def process_single_file(file_path: str, output_path: str = "configs/video_descri
         logger.error(f"Error processing file: {e}")
         return False
 
+async def process_files(file_paths: List[str], output_path: str, api_key: Optional[str] = None,
+                        file_concurrency: int = 4, request_concurrency: int = 8, force: bool = False,
+                        **options) -> Dict[str, int]:
+    """
+    Generate metadata for new and changed files concurrently and save it to output_path.
+
+    Files whose content hash matches the manifest (and that already have a
+    description) are skipped unless `force` is set. At most `file_concurrency`
+    files are processed at a time and at most `request_concurrency` Claude
+    requests are in flight across all of them. Results are written once, at the
+    end of the run, with an atomic rename. Other keyword options are passed to
+    process_text_file_async.
+    """
+    manifest = HashManifest(f"{os.path.splitext(output_path)[0]}.manifest.json")
+    json_content = load_json(output_path, {"videos": {}})
+    counts = {'successful': 0, 'failed': 0, 'skipped': 0}
+
+    pending = []
+    for file_path in file_paths:
+        fingerprint = manifest.fingerprint(file_path)
+        described = Path(file_path).stem in json_content.get("videos", {})
+        if force or not described or manifest.is_changed(file_path, fingerprint):
+            pending.append((file_path, fingerprint))
+        else:
+            # Unchanged, but remember a fresh mtime so it is not re-hashed next time
+            manifest.update(file_path, fingerprint)
+            counts['skipped'] += 1
+
+    logger.info(f"{len(pending)} file(s) to process, {counts['skipped']} unchanged")
+    if not pending:
+        manifest.save()
+        return counts
+
+    client = create_client(api_key)
+    file_semaphore = asyncio.Semaphore(file_concurrency)
+    request_semaphore = asyncio.Semaphore(request_concurrency)
+    started = time.monotonic()
+
+    async def process(file_path: str, fingerprint: Dict):
+        async with file_semaphore:
+            try:
+                metadata = await process_text_file_async(file_path, client, request_semaphore, **options)
+                add_video_entry(json_content, metadata)
+                manifest.update(file_path, fingerprint)
+                counts['successful'] += 1
+            except Exception:
+                counts['failed'] += 1
+
+        # Progress with a rough ETA based on the average time per finished file
+        done = counts['successful'] + counts['failed']
+        elapsed = time.monotonic() - started
+        eta = elapsed / done * (len(pending) - done)
+        logger.info(f"[{done}/{len(pending)}] {Path(file_path).name} - elapsed {elapsed:.0f}s, ETA {eta:.0f}s")
+
+    try:
+        await asyncio.gather(*(process(file_path, fingerprint) for file_path, fingerprint in pending))
+    finally:
+        await client.close()
+        if any(file_path.endswith('.pdf') for file_path, _ in pending):
+            from bot.utils.pdf_extraction import get_pdf_extractor
+            get_pdf_extractor().close()
+        # Whatever finished is saved, even if the run was interrupted
+        if counts['successful']:
+            atomic_write_json(json_content, output_path, indent=4)
+            logger.info(f"Successfully saved metadata to {output_path}")
+        manifest.save()
+    return counts
+
 def main():
+    parser = argparse.ArgumentParser(description='Generate names and descriptions for PDF/text materials with Claude')
+    parser.add_argument('--file-concurrency', type=int, default=4, help='Files processed at the same time')
+    parser.add_argument('--request-concurrency', type=int, default=8, help='Claude requests in flight at the same time')
+    parser.add_argument('--mode', choices=['structured', 'separate'], default='structured',
+                        help='One JSON call per document or one call per field')
+    parser.add_argument('--long-input', choices=['truncate', 'map-reduce'], default='truncate',
+                        help='How to handle documents over the input token budget')
+    parser.add_argument('--max-input-tokens', type=int, default=30000, help='Approximate input token budget per request')
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument('--changed-only', action='store_true',
+                           help='Only process new or changed files (default)')
+    selection.add_argument('--force', action='store_true', help='Regenerate descriptions for all files')
+    args = parser.parse_args()
+
     # Load environment variables from .env file
     load_dotenv()
 
@@ -178,11 +465,6 @@ def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
 
-    # Check for API key before processing
-    if not os.getenv('CLAUDE_API_KEY'):
-        logger.error("CLAUDE_API_KEY not found in environment variables")
-        return
-    
     # Get the project root directory and set up paths
     project_root = Path(__file__).parent.parent.parent
     input_dir = project_root / 'data' / 'pdf'
@@ -194,21 +476,26 @@ def main():
         return
 
     # Process all .txt and .pdf files in the directory
-    successful = 0
-    failed = 0
-
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(('.txt', '.pdf')):
-            file_path = input_dir / file_name
-            logger.info(f"Processing file: {file_name}")
-
-            if process_single_file(str(file_path), str(output_path)):
-                successful += 1
-            else:
-                failed += 1
+    file_paths = [str(input_dir / file_name) for file_name in sorted(os.listdir(input_dir))
+                  if file_name.endswith(('.txt', '.pdf'))]
+    try:
+        counts = asyncio.run(process_files(file_paths, str(output_path),
+                                           force=args.force,
+                                           file_concurrency=args.file_concurrency,
+                                           request_concurrency=args.request_concurrency,
+                                           mode=args.mode,
+                                           long_input=args.long_input,
+                                           max_input_tokens=args.max_input_tokens))
+    except ValueError as ve:
+        # Raised before any request when CLAUDE_API_KEY is missing
+        logger.error(f"API Key Error: {ve}")
+        return
     
     # Print summary
-    logger.info(f"Processing complete. Successfully processed: {successful}, Failed: {failed}")
+    logger.info(f"Processing complete. Successfully processed: {counts['successful']}, "
+                f"Failed: {counts['failed']}, Unchanged: {counts['skipped']}")
+    logger.info(f"Claude usage: {token_usage['requests']} requests, "
+                f"{token_usage['input_tokens']} input / {token_usage['output_tokens']} output tokens")
 
 if __name__ == "__main__":
     main()
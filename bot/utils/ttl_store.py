@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TTLStore:
+    """
+    Bounded key-value store with LRU + TTL eviction.
+
+    Keeps at most `max_entries` values in memory; the least recently used entry
+    is evicted first and every entry expires `ttl` seconds after it was written.
+    When `sqlite_path` is given, values (which must be JSON-serializable) are also
+    written through to a SQLite table, so they survive restarts and are reloaded
+    into memory on first access. SQLite queries run inline on the event loop, so
+    a write waits only briefly for another process's lock and then fails.
+    """
+
+    PURGE_EVERY_WRITES = 1000
+    # Seconds a write waits for another process's lock (same as SQLiteStorage.BUSY_TIMEOUT)
+    BUSY_TIMEOUT = 0.2
+
+    def __init__(self, name: str, max_entries: int = 10000, ttl: Optional[float] = 3600,
+                 sqlite_path: Optional[str] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        self._entries: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._writes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+        self.connection = None
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self.connection = sqlite3.connect(sqlite_path, timeout=self.BUSY_TIMEOUT, check_same_thread=False,
+                                              isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS ttl_store ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def _remember(self, key: str, expires_at: Optional[float], value: Any):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _load(self, key: str) -> Tuple[bool, Any]:
+        if self.connection is None:
+            return False, None
+        row = self.connection.execute(
+            "SELECT value, expires_at FROM ttl_store WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (self.name, key, time.time())
+        ).fetchone()
+        if not row:
+            return False, None
+        value = json.loads(row[0])
+        self._remember(key, row[1], value)
+        return True, value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get value by key, returns default when missing or expired"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return value
+            del self._entries[key]
+            self.stats['expirations'] += 1
+
+        found, value = self._load(key)
+        if found:
+            self.stats['hits'] += 1
+            return value
+        self.stats['misses'] += 1
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store value; `ttl` overrides the store default for this entry"""
+        expires_at = self._expires_at(ttl)
+        self._remember(key, expires_at, value)
+
+        if self.connection is not None:
+            try:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO ttl_store (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.name, key, json.dumps(value, ensure_ascii=False), expires_at)
+                )
+                self._writes += 1
+                if self._writes % self.PURGE_EVERY_WRITES == 0:
+                    self.purge_expired()
+            except (TypeError, ValueError, sqlite3.Error) as e:
+                logging.warning(f"TTLStore '{self.name}': failed to persist key {key}: {e}")
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """Remove key and return its value"""
+        value = self.get(key, default)
+        self._entries.pop(key, None)
+        if self.connection is not None:
+            try:
+                self.connection.execute("DELETE FROM ttl_store WHERE namespace = ? AND key = ?", (self.name, key))
+            except sqlite3.Error as e:
+                logging.warning(f"TTLStore '{self.name}': failed to delete key {key}: {e}")
+        return value
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from memory and the persistent tier"""
+        now = time.time()
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        self.stats['expirations'] += len(expired)
+
+        removed = len(expired)
+        if self.connection is not None:
+            cursor = self.connection.execute(
+                "DELETE FROM ttl_store WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (self.name, now)
+            )
+            removed += cursor.rowcount
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'size': len(self._entries),
+            'hit_ratio': self.stats['hits'] / lookups if lookups else 0.0
+        }
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_MISSING = object()
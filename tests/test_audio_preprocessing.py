@@ -0,0 +1,22 @@
+import numpy as np
+from bot.services.audio_preprocessing import SAMPLE_RATE, PreprocessedAudio, split_at_pauses
+
+
+def make_audio(duration: float, speech_segments) -> PreprocessedAudio:
+    samples = np.zeros(int(duration * SAMPLE_RATE), dtype=np.float32)
+    return PreprocessedAudio(samples, duration, speech_segments)
+
+
+def test_pause_crossing_the_limit_is_not_a_chunk_of_its_own():
+    audio = make_audio(150, [(0, 55), (80, 150)])
+    chunks = split_at_pauses(audio, 60)
+    assert chunks[0] == (0.0, 60)
+    assert chunks[1][0] == 80
+    for start, end in chunks:
+        assert end - start <= 60
+        assert audio.slice(start, end).speech_segments
+
+
+def test_cut_at_pause_nearest_the_limit_without_slivers():
+    audio = make_audio(4.0, [(0.0, 1.7), (2.04, 3.48), (3.7, 4.0)])
+    assert split_at_pauses(audio, 1.5) == [(0.0, 1.5), (1.5, 2.04), (2.04, 3.54), (3.7, 4.0)]
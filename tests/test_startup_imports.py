@@ -0,0 +1,11 @@
+from bot.utils.import_report import DEFAULT_FORBIDDEN, find_forbidden, measure_imports
+
+
+def test_bot_startup_does_not_import_heavy_packages():
+    records = measure_imports('bot.main')
+    assert find_forbidden(records, DEFAULT_FORBIDDEN) == []
+
+
+def test_heavy_import_is_detected():
+    records = measure_imports('bot.services.rag_pipeline')
+    assert 'langchain' in find_forbidden(records, DEFAULT_FORBIDDEN)